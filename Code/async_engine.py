@@ -0,0 +1,453 @@
+import asyncio
+import itertools
+import random
+import httpx
+from notion_client import AsyncClient, APIResponseError
+from tqdm import tqdm
+from config import NOTION_TOKEN, DATABASE_ID
+import book_parser
+import http_cache
+import http_client
+import metrics
+import mirror
+import notion_api
+import parse_pool
+import resolver
+from notion_api import ID_IS_EMPTY, ID_IS_NOT_EMPTY, refresh_changes, build_update_payload
+from goodreads import describe_new_entry, report_failures, page_title
+from journal import RunJournal
+from refresh_state import RefreshState, RefreshBudget
+from rate_limiter import limited_async, retry_after_seconds, NOTION_HOST
+
+# Requests allowed in flight at once to each service (main.py sets Goodreads from
+# --concurrency); the per-host rate limits in rate_limiter.py still apply on top
+GOODREADS_CONCURRENCY = 16
+NOTION_CONCURRENCY = 8
+
+# Mirrored pages read per trip to a worker thread when streaming the local mirror
+MIRROR_BATCH = 500
+
+def backoff(attempt):
+    return http_client.BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, http_client.BACKOFF_JITTER)
+
+class AsyncEngine:
+    """
+    asyncio counterpart of the Goodreads and Notion functions, for keeping many requests in
+    flight at once. Use it as `async with AsyncEngine() as engine:`. Goodreads pages go
+    through the same on-disk cache and rate limits as the sync code, and Notion writes use
+    the same payloads. A semaphore per service bounds the requests in flight. Parsing runs
+    off the event loop, on parse_executor if one is given and the default thread pool
+    otherwise; book pages go on to the process pool in parse_pool.py when it is enabled.
+    Disk and SQLite work (the HTTP cache, the run journal, the resolver memo) runs on worker
+    threads through blocking(), so a commit never stalls the requests in flight.
+    """
+    def __init__(self, goodreads_concurrency=None, notion_concurrency=None, parse_executor=None):
+        self.goodreads_concurrency = goodreads_concurrency or GOODREADS_CONCURRENCY
+        self.notion_concurrency = notion_concurrency or NOTION_CONCURRENCY
+        self.parse_executor = parse_executor
+
+    async def __aenter__(self):
+        self.http = httpx.AsyncClient(
+            headers={'User-Agent': http_client.USER_AGENT, 'Accept-Encoding': http_client.ACCEPT_ENCODING},
+            timeout=httpx.Timeout(http_client.READ_TIMEOUT, connect=http_client.CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=self.goodreads_concurrency,
+                                max_keepalive_connections=self.goodreads_concurrency),
+            follow_redirects=True,
+        )
+        self.notion = AsyncClient(auth=NOTION_TOKEN)
+        self.goodreads_slots = asyncio.Semaphore(self.goodreads_concurrency)
+        self.notion_slots = asyncio.Semaphore(self.notion_concurrency)
+        self.schema_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.http.aclose()
+        await self.notion.aclose()
+
+    # Goodreads
+
+    async def fetch(self, url, headers=None):
+        """
+        GET a Goodreads URL, retrying connection errors and 429/5xx responses with the same
+        jittered backoff (and respect for Retry-After) as http_client's session.
+        """
+        for attempt in range(http_client.MAX_RETRIES + 1):
+            try:
+                async with self.goodreads_slots, limited_async(url) as outcome:
+                    with metrics.timer('fetch'):
+                        response = await self.http.get(url, headers=headers)
+                    outcome.report(response.status_code, response.headers)
+            except httpx.TransportError:
+                if attempt == http_client.MAX_RETRIES:
+                    raise
+                delay = backoff(attempt)
+            else:
+                if response.status_code not in http_client.RETRY_STATUSES or attempt == http_client.MAX_RETRIES:
+                    metrics.count('requests')
+                    metrics.count('bytes downloaded', len(response.content))
+                    return response
+                delay = retry_after_seconds(response.headers) or backoff(attempt)
+            metrics.count('http retries')
+            await asyncio.sleep(delay)
+
+    async def cached_get(self, url, kind):
+        """
+        Async http_cache.cached_get: fresh pages come from the on-disk cache, stale ones are
+        revalidated.
+        """
+        if not http_cache.CACHE_ENABLED:
+            return await self.fetch(url)
+        cache = await self.blocking(http_cache.get_cache)
+        entry = await self.blocking(cache.lookup, url)
+        if http_cache.is_fresh(entry, kind):
+            await self.blocking(cache.touch, url)
+            metrics.count('cache hits')
+            return http_cache.CachedResponse(200, entry['text'], from_cache=True)
+        response = await self.fetch(url, http_cache.revalidation_headers(entry))
+        return await self.blocking(http_cache.settle, cache, url, entry, response)
+
+    async def parse(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.parse_executor, function, *args)
+
+    async def blocking(self, function, *args):
+        # Disk or SQLite work, on a worker thread so the event loop keeps serving requests
+        return await asyncio.to_thread(function, *args)
+
+    async def get_goodreads_id(self, title):
+        response = await self.cached_get(resolver.search_url(title), 'search')
+        if response.status_code != 200:
+            print("Failed to retrieve search results")
+            return None
+        book_id = await self.parse(book_parser.parse_search_page, response.text, book_parser.PARSER_BACKEND)
+        if book_id is None:
+            print("Book not found")
+        return book_id
+
+    async def search_results(self, title, searches=None):
+        """
+        Top search results for a title. With a `searches` dictionary, concurrent calls for
+        titles that normalize the same share one request.
+        """
+        async def search():
+            response = await self.cached_get(resolver.search_url(title), 'search')
+            if response.status_code != 200:
+                raise ValueError(f"search for {title} failed with HTTP {response.status_code}")
+            return await self.parse(book_parser.parse_search_results, response.text, resolver.SEARCH_RESULTS,
+                                    book_parser.PARSER_BACKEND)
+
+        if searches is None:
+            return await search()
+        title_key = resolver.normalize_title(title)
+        if title_key not in searches:
+            searches[title_key] = asyncio.ensure_future(search())
+        return await searches[title_key]
+
+    async def resolve_title(self, title, author='', searches=None):
+        """
+        Async resolver.resolve_title: the best remembered or scored match, or None.
+        """
+        key = resolver.match_key(title, author)
+        memo = await self.blocking(resolver.get_memo)
+        resolution = await self.blocking(memo.lookup, key)
+        if resolution is not None:
+            return resolution
+        return await self.blocking(resolver.best_match, key, await self.search_results(title, searches))
+
+    async def scrape_book_info(self, book_id):
+        response = await self.cached_get('https://www.goodreads.com/book/show/' + book_id, 'book')
+        if response.status_code != 200:
+            print("Failed to retrieve the page")
+            return None
+        # In the parse pool when one is configured; the executor thread waits for it off the loop
+        return await self.parse(parse_pool.parse_book_response, response, book_id)
+
+    # Notion
+
+    async def notion_call(self, stage, function, **kwargs):
+        """
+        Make a Notion API call within the Notion semaphore and rate limit, retrying 429s after
+        Retry-After or with jittered exponential backoff, like notion_api.send_page_update.
+        """
+        for attempt in range(notion_api.MAX_WRITE_RETRIES):
+            try:
+                async with self.notion_slots, limited_async(NOTION_HOST) as outcome:
+                    try:
+                        with metrics.timer(stage):
+                            response = await function(**kwargs)
+                    except APIResponseError as e:
+                        outcome.report(e.status, getattr(e, 'headers', None))
+                        raise
+                    outcome.report(200)
+                    return response
+            except APIResponseError as e:
+                if e.status != 429 or attempt == notion_api.MAX_WRITE_RETRIES - 1:
+                    raise
+                metrics.count('notion retries')
+                await asyncio.sleep(retry_after_seconds(getattr(e, 'headers', None)) or 2 ** attempt + random.uniform(0, 1))
+
+    async def query_database(self, filter=None, page_size=100):
+        """
+        Yield every page in the database, requesting the next batch while the current one is consumed.
+        """
+        def query(cursor):
+            arguments = {"database_id": DATABASE_ID, "page_size": page_size}
+            if filter is not None:
+                arguments["filter"] = filter
+            if cursor is not None:
+                arguments["start_cursor"] = cursor
+            return asyncio.ensure_future(self.notion_call('query', self.notion.databases.query, **arguments))
+
+        pending = query(None)
+        try:
+            while pending is not None:
+                response = await pending
+                if response.get("has_more") and response.get("next_cursor"):
+                    pending = query(response["next_cursor"])
+                else:
+                    pending = None
+                for page in response.get("results", []):
+                    yield page
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def database_pages(self, filter=None):
+        """
+        Async mirror.database_pages: the local mirror when it is enabled, otherwise the API.
+        """
+        if mirror.MIRROR_ENABLED:
+            # Stream the mirror a batch at a time, as the sync path does, instead of loading it whole
+            pages = await self.blocking(mirror.database_pages, filter)
+            while True:
+                batch = await self.blocking(lambda: list(itertools.islice(pages, MIRROR_BATCH)))
+                if not batch:
+                    break
+                for page in batch:
+                    yield page
+        else:
+            async for page in self.query_database(filter):
+                yield page
+
+    async def find_page_by_title(self, title):
+        if mirror.MIRROR_ENABLED:
+            return await asyncio.to_thread(mirror.find_page_by_title, title)
+        try:
+            response = await self.notion_call('query', self.notion.databases.query, database_id=DATABASE_ID,
+                                              filter={"property": "Name", "title": {"equals": title}})
+            return response.get("results")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
+    async def ensure_schema(self):
+        # Load the schema without blocking the loop, so build_update_payload finds it cached
+        async with self.schema_lock:
+            if not notion_api.schema_is_current():
+                database = await self.notion_call('schema', self.notion.databases.retrieve, database_id=DATABASE_ID)
+                notion_api.set_database_schema(database.get("properties", {}))
+
+    async def send_page_update(self, page_id, payload):
+        response = await self.notion_call('write', self.notion.pages.update, page_id=page_id, **payload)
+        notion_api.remember_written_options(payload)
+        notion_api.page_written(response)
+        return response
+
+    async def update_page(self, page_id, series=None, rating=None, num_ratings=None, page_cnt=None, genres=None,
+                          pub_date=None, summary=None, author=None, pid=None, cover=None, sort_author=None,
+                          create_genres=False):
+        """
+        Async notion_api.update_page; returns whether the update succeeded.
+        """
+        if genres is not None and not create_genres:
+            await self.ensure_schema()
+        payload = build_update_payload(series, rating, num_ratings, page_cnt, genres, pub_date,
+                                       summary, author, pid, cover, sort_author, create_genres)
+        try:
+            await self.send_page_update(page_id, payload)
+            return True
+        except Exception as e:
+            print(f"Failed to update page: {str(e)}")
+            return False
+
+    async def update_with_packet(self, page_id, packet):
+        return await self.update_page(page_id, packet.series, packet.rating, packet.num_ratings, packet.pages,
+                                      list(packet.genres), packet.publication_date, packet.summary, packet.author,
+                                      packet.pid, packet.cover, packet.sort_author)
+
+    async def refresh_with_packet(self, page_id, packet):
+        return await self.update_page(page_id, rating=packet.rating, num_ratings=packet.num_ratings)
+
+    # Commands
+
+    async def fetch_new_entry(self, page, searches, packets):
+        """
+        Async goodreads.fetch_new_entry, printing each entry's report in one piece once it is done.
+        """
+        name = mirror.rich_text_value(page, "Name", "title")
+        author = mirror.rich_text_value(page, "Author", "rich_text")
+        resolution = await self.resolve_title(name, author, searches)
+        report = '\n ----- ' + name + ' -----'
+        if resolution is None:
+            print(report + '\nBook not found')
+            return 'no match'
+        goodreads_id = resolution['id']
+        if resolution['confidence'] < resolver.MIN_CONFIDENCE:
+            await self.blocking(resolver.get_memo().queue_review, page['id'], name, author, resolution)
+            print(report + f"\n      Best match #{goodreads_id} ({resolution['title']}) scored "
+                           f"{resolution['confidence']:.2f}; queued for review")
+            return 'review'
+
+        # The same book may be queued more than once; scrape it only once per run
+        if goodreads_id not in packets:
+            packets[goodreads_id] = asyncio.ensure_future(self.scrape_book_info(goodreads_id))
+        metadata = await packets[goodreads_id]
+        if metadata is None:
+            raise ValueError(f"could not scrape Goodreads ID #{goodreads_id}")
+        if not await self.update_with_packet(page['id'], metadata):
+            raise RuntimeError("the Notion update failed")
+        print(report + f"\n      Found ID #{goodreads_id} (confidence {resolution['confidence']:.2f})\n"
+              + describe_new_entry(metadata))
+        return 'updated'
+
+    async def check_and_fetch_ids(self, resume=False):
+        """
+        Async goodreads.check_and_fetch_ids: every entry without an ID is resolved, scraped and
+        written concurrently, within the per-service limits.
+        """
+        print('The following pages were updated with new IDs:')
+        failures = []
+        outcomes = []
+        with RunJournal('get_new', resume) as journal:
+            searches = {}
+            packets = {}
+
+            async def handle(page):
+                # A malformed page or failed request only affects its own entry
+                try:
+                    outcome = await self.fetch_new_entry(page, searches, packets)
+                    await self.blocking(journal.record, page['id'], outcome)
+                    outcomes.append(outcome)
+                except Exception as e:
+                    await self.blocking(journal.record, page['id'], 'failed', str(e))
+                    failures.append((page, e))
+
+            try:
+                pages = [page async for page in self.database_pages(filter=ID_IS_EMPTY)
+                         if not journal.done(page['id']) and mirror.rich_text_value(page, "Name", "title")]
+                await asyncio.gather(*(handle(page) for page in pages))
+            except asyncio.CancelledError:
+                print("Interrupted; rerun with --resume to continue")
+                raise
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            finally:
+                for future in list(searches.values()) + list(packets.values()):
+                    future.cancel()
+
+        reviews = outcomes.count('review')
+        if reviews:
+            print(f"{reviews} low-confidence match(es) queued; run with --review to confirm them.")
+        report_failures(failures)
+
+    async def refresh_entry(self, page, journal, state):
+        """
+        Async goodreads.refresh_entry for the ratings refresh: only changed properties are written.
+        """
+        id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
+        if not id_property:
+            return None
+        id = id_property[0]['text']['content']
+        packet = await self.scrape_book_info(id)
+        if packet is None:
+            raise ValueError(f"could not scrape Goodreads ID #{id}")
+        state.observe(page['id'], id, packet.num_ratings)
+        changes = refresh_changes(page, packet)
+        if not changes:
+            await self.blocking(journal.record, page['id'], 'unchanged')
+            return 'unchanged'
+        await self.send_page_update(page['id'], build_update_payload(**changes))
+        await self.blocking(journal.record, page['id'], 'updated')
+        return 'updated'
+
+    async def update_all_ids(self, resume=False, stale_after=None, max_pages=None, max_minutes=None):
+        """
+        Async goodreads.update_all_ids. A fixed set of worker tasks, as many as the Goodreads
+        concurrency, takes pages from a bounded queue, so memory stays flat on large databases.
+        Ctrl-C cancels every worker; the journal and refresh state are closed either way, so
+        the run can be continued with --resume.
+        """
+        print('Updating data for all known IDs...')
+        failures = []
+        outcomes = {'updated': 0, 'unchanged': 0}
+        journal = RunJournal('update', resume)
+        state = RefreshState()
+        journal.listeners.append(state.record)
+        budget = RefreshBudget(max_pages, max_minutes * 60 if max_minutes is not None else None)
+        queue = asyncio.Queue(maxsize=self.goodreads_concurrency * 2)
+
+        with tqdm(desc="Updating IDs", unit="entry") as pbar:
+            async def worker():
+                while True:
+                    page = await queue.get()
+                    try:
+                        outcome = await self.refresh_entry(page, journal, state)
+                        if outcome is not None:
+                            outcomes[outcome] += 1
+                            pbar.set_description(f"Updated: {page_title(page)}")
+                    except Exception as e:
+                        await self.blocking(journal.record, page['id'], 'failed', str(e))
+                        failures.append((page, e))
+                    finally:
+                        queue.task_done()
+                    pbar.update(1)
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.goodreads_concurrency)]
+            try:
+                pages = self.database_pages(filter=ID_IS_NOT_EMPTY)
+                if stale_after is not None:
+                    stale = state.stale_pages([page async for page in pages], stale_after)
+                    print(f"{len(stale)} page(s) not refreshed in the last {stale_after:g} day(s)")
+                    pbar.total = len(stale)
+
+                    async def stale_pages():
+                        for page in stale:
+                            yield page
+                    pages = stale_pages()
+                async for page in pages:
+                    if journal.done(page['id']):
+                        pbar.update(1)
+                        continue
+                    if not budget.allow():
+                        break
+                    await queue.put(page)
+                await queue.join()
+            except asyncio.CancelledError:
+                tqdm.write("Interrupted; rerun with --resume to continue")
+                raise
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await self.blocking(journal.close)
+                await self.blocking(state.close)
+
+        if budget.stopped is not None:
+            print(f"Stopped after {budget.handed_out} page(s): {budget.stopped} budget reached")
+        print(f"{outcomes['unchanged']} unchanged page(s) skipped, {outcomes['updated']} updated, {len(failures)} failed")
+        report_failures(failures)
+
+def run(command, concurrency=None, parse_executor=None, **kwargs):
+    """
+    Run one of the engine's commands ('check_and_fetch_ids' or 'update_all_ids') to completion.
+    On Ctrl-C, asyncio cancels the command, which cancels everything it started before returning.
+    """
+    async def main():
+        async with AsyncEngine(concurrency, parse_executor=parse_executor) as engine:
+            await getattr(engine, command)(**kwargs)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
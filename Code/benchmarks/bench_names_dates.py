@@ -0,0 +1,108 @@
+"""
+Check format_names and parse_dates against the legacy format_name and parse_date, and compare
+their throughput on a synthetic library in which, as in a real one, many books share authors
+and publication dates. Run from the Code directory:
+
+    python -m benchmarks.bench_names_dates [--books 20000] [--authors 2000] [--seconds 2]
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+import utilities
+from benchmarks import legacy_utilities
+
+FIRST_NAMES = ['Ursula', 'John', 'Mary', 'Terry', 'Octavia', 'Neil', 'Jane', 'Robin', 'Ann', 'Kazuo', 'Isaac', 'N.K.']
+LAST_NAMES = ['Le Guin', 'Tolkien', 'Shelley', 'Pratchett', 'Butler', 'Gaiman', 'Austen', 'Hobb', 'Leckie',
+              'Ishiguro', 'Asimov', 'Jemisin', 'Van Vogt', 'De Camp', 'Smith Jr.', 'King III']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+def synthetic_library(books, authors, seed=0):
+    """
+    Author names and publication date strings for `books` books by `authors` distinct authors,
+    with popular authors appearing far more often than others. About one date in ten is a
+    bare year, as Goodreads shows for older editions.
+    """
+    rng = random.Random(seed)
+    people = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}" if i % 3 else
+              f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for i in range(authors)]
+    names = [people[min(int(rng.paretovariate(1.2)) - 1, authors - 1)] for _ in range(books)]
+    dates = []
+    for _ in range(books):
+        year = rng.randint(1900, 2024)
+        if rng.random() < 0.1:
+            dates.append(str(year))
+        else:
+            dates.append(f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {year}")
+    return names, dates
+
+def check_outputs(names, dates):
+    """
+    Return the inputs for which the batch functions disagree with the legacy ones.
+    """
+    mismatches = []
+    for name, formatted in zip(names, utilities.format_names(names)):
+        if formatted != legacy_utilities.format_name(name):
+            mismatches.append(('name', name, formatted))
+    with quiet():
+        for date_string, parsed in zip(dates, utilities.parse_dates(dates)):
+            if parsed.value != legacy_utilities.parse_date(date_string):
+                mismatches.append(('date', date_string, parsed))
+    return mismatches
+
+@contextlib.contextmanager
+def quiet():
+    # The legacy parse_date prints on every year-only date
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def items_per_second(run, items, seconds, clear_cache=False):
+    """
+    Call run(items) repeatedly for `seconds`. With clear_cache, the memo is emptied before
+    every pass, so each pass starts cold like a fresh process.
+    """
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if clear_cache:
+            utilities.format_name.cache_clear()
+            utilities.parse_date_result.cache_clear()
+        run(items)
+        count += len(items)
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch name formatting and date parsing against the legacy functions.')
+    parser.add_argument('--books', type=int, default=20000, help='Names and dates in the synthetic library')
+    parser.add_argument('--authors', type=int, default=2000, help='Distinct authors in the synthetic library')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time spent timing each implementation')
+    args = parser.parse_args()
+
+    names, dates = synthetic_library(args.books, args.authors)
+    mismatches = check_outputs(names, dates)
+    for kind, value, output in mismatches[:20]:
+        print(f"Mismatch for {kind} {value!r}: {output!r}")
+    if mismatches:
+        raise SystemExit(1)
+    print(f"All {len(names)} names and {len(dates)} dates match the legacy functions")
+
+    cases = [
+        ('names', 'legacy', lambda items: [legacy_utilities.format_name(name) for name in items], names, False),
+        ('names', 'batch cold', utilities.format_names, names, True),
+        ('names', 'batch', utilities.format_names, names, False),
+        ('dates', 'legacy', lambda items: [legacy_utilities.parse_date(text) for text in items], dates, False),
+        ('dates', 'batch cold', utilities.parse_dates, dates, True),
+        ('dates', 'batch', utilities.parse_dates, dates, False),
+    ]
+    baseline = {}
+    with quiet():
+        results = [(kind, label, items_per_second(run, items, args.seconds, clear_cache))
+                   for kind, label, run, items, clear_cache in cases]
+    for kind, label, rate in results:
+        baseline.setdefault(kind, rate)
+        print(f"{kind} {label + ':':12} {rate:12.0f}/s ({rate / baseline[kind]:.2f}x)")
+
+if __name__ == "__main__":
+    main()
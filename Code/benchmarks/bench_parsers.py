@@ -0,0 +1,86 @@
+"""
+Check that every parser backend reads the same BookMetadata from each recorded fixture and
+from synthetic pages with and without embedded JSON-LD, so the JSON-LD rating, page count
+and image are compared with what the full html.parser tree reads from the markup. Targeted
+backends are called without the fallback to the full tree, so a strainer that drops an
+element shows up as an error instead of silently costing a second parse. Exits non-zero on
+any difference. Run from the Code directory:
+
+    python -m benchmarks.bench_parsers [--pages 100]
+"""
+import argparse
+import time
+from benchmarks import fakes
+import book_parser
+
+def sample_pages(count):
+    """
+    (label, book ID, html) for each recorded fixture, then `count` synthetic pages with
+    JSON-LD and `count` without.
+    """
+    pages = [(f"fixture {i}", str(i), html) for i, html in enumerate(fakes.load_fixtures())]
+    for json_ld in (True, False):
+        for i in range(count):
+            book_id = str(1000 + i)
+            label = f"synthetic {book_id}{' with JSON-LD' if json_ld else ''}"
+            pages.append((label, book_id, fakes.synthetic_book_page(book_id, json_ld=json_ld)))
+    return pages
+
+def parse(html, book_id, backend):
+    # The backend on its own: targeted backends get no second chance on the full tree
+    json_ld = book_parser.extract_json_ld(html) if book_parser.BACKENDS[backend][1] else None
+    return book_parser.parse_book_soup(html, book_id, backend, json_ld)
+
+def differences(expected, actual):
+    # Names of the fields on which two BookMetadata disagree, with both values
+    return [(name, getattr(expected, name), getattr(actual, name)) for name in expected.__slots__
+            if getattr(expected, name) != getattr(actual, name)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the parser backends agree on every page.')
+    parser.add_argument('--pages', type=int, default=100, help='Synthetic pages of each kind to check')
+    args = parser.parse_args()
+
+    backends = [backend for backend in book_parser.BACKENDS
+                if backend != 'lxml' or book_parser.LXML_AVAILABLE]
+    pages = sample_pages(args.pages)
+    problems = 0
+    seconds = dict.fromkeys(backends, 0.0)
+
+    for label, book_id, html in pages:
+        # The full html.parser tree, reading everything from the markup, is the reference
+        results = {}
+        for backend in backends:
+            start = time.perf_counter()
+            try:
+                results[backend] = parse(html, book_id, backend)
+            except Exception as e:
+                results[backend] = e
+            seconds[backend] += time.perf_counter() - start
+
+        expected = results['soup']
+        if isinstance(expected, Exception):
+            print(f"{label}: soup failed: {expected}")
+            problems += 1
+            continue
+        for backend in backends:
+            actual = results[backend]
+            if isinstance(actual, Exception):
+                print(f"{label}: {backend} failed: {actual!r}")
+                problems += 1
+                continue
+            for name, want, got in differences(expected, actual):
+                print(f"{label}: {backend} read {name} as {got!r}, soup as {want!r}")
+                problems += 1
+
+    for backend in backends:
+        print(f"{backend + ':':10} {seconds[backend] / len(pages) * 1000:7.2f} ms/page")
+    if problems:
+        print(f"{problems} difference(s) across {len(pages)} page(s)")
+        raise SystemExit(1)
+    print(f"All {len(backends)} backends agree on {len(pages)} page(s)")
+    if not any(label.startswith('fixture') for label, _, _ in pages):
+        print("No recorded fixtures: only synthetic pages were checked (record some with bench_pipeline --record)")
+
+if __name__ == "__main__":
+    main()
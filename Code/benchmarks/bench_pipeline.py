@@ -0,0 +1,217 @@
+"""
+Offline benchmark of the --update pipeline. Goodreads pages are replayed from
+benchmarks/fixtures, or generated when none have been recorded (none are committed), and Notion is replaced by a synthetic database with
+configurable latency and 429 injection, so concurrency, caching and parser settings can be
+compared reproducibly. Each configuration runs in its own child process so that its peak
+resident memory can be reported. Run from the Code directory:
+
+    python -m benchmarks.bench_pipeline --rows 100 1000 10000 --workers 1 8
+    python -m benchmarks.bench_pipeline --record 2767052 5907   # save live pages as fixtures
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks import fakes
+import journal
+import async_engine
+import book_parser
+import goodreads
+import http_cache
+import http_client
+import metrics
+import notion_api
+import parse_pool
+import rate_limiter
+
+STAGES = ('fetch', 'parse', 'clean', 'write')
+
+@contextlib.contextmanager
+def patched(obj, name, value):
+    original = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, original)
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_update(rows, workers, cache, backend, notion_latency, goodreads_latency, rate_limit_rate, rate_limits, engine='sync',
+               parse_workers=0):
+    """
+    Run update_all_ids once against the fakes in a scratch directory and return its measurements.
+    With engine='async', the asyncio engine runs it instead, with `workers` Goodreads requests in flight.
+    """
+    if engine == 'async':
+        # The fakes' own latency would block the event loop; the async wrappers await it instead
+        notion = fakes.FakeNotionClient(rows, 0.0, rate_limit_rate)
+        site = fakes.FakeGoodreads(0.0)
+        async_notion = fakes.AsyncFakeNotionClient(notion, notion_latency)
+        async_site = fakes.AsyncFakeGoodreads(site, goodreads_latency)
+    else:
+        notion = fakes.FakeNotionClient(rows, notion_latency, rate_limit_rate)
+        site = fakes.FakeGoodreads(goodreads_latency)
+
+    scratch = tempfile.mkdtemp(prefix='bookdb-bench-')
+    cwd = os.getcwd()
+    with contextlib.ExitStack() as stack:
+        os.chdir(scratch)
+        stack.callback(shutil.rmtree, scratch, ignore_errors=True)
+        stack.callback(os.chdir, cwd)
+        stack.enter_context(patched(notion_api, 'notion_client', notion))
+        stack.enter_context(patched(http_client, 'get', site.get))
+        if engine == 'async':
+            stack.enter_context(patched(async_engine, 'AsyncClient', lambda **options: async_notion))
+            stack.enter_context(patched(async_engine.httpx, 'AsyncClient', lambda **options: async_site))
+        stack.enter_context(patched(book_parser, 'PARSER_BACKEND', backend))
+        stack.enter_context(patched(http_cache, 'CACHE_ENABLED', cache != 'off'))
+        stack.enter_context(patched(http_cache, '_cache', None))
+        stack.enter_context(patched(parse_pool, 'PARSE_WORKERS', parse_workers))
+        stack.callback(parse_pool.shutdown)
+        if not rate_limits:
+            for host in (rate_limiter.GOODREADS_HOST, rate_limiter.NOTION_HOST):
+                rate_limiter.set_rate(host, 1e9, 1e9)
+            stack.callback(rate_limiter.reset_rates)
+        notion_api.invalidate_schema_cache()
+        metrics.enable()
+        metrics.reset()
+
+        def update(workers):
+            if engine == 'async':
+                async_engine.run('update_all_ids', workers)
+            else:
+                goodreads.update_all_ids(workers=workers)
+
+        quiet = io.StringIO()
+        if cache == 'warm':
+            # Fill the cache first, then measure a second run against it
+            with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+                update(workers)
+            metrics.reset()
+            site.requests = site.bytes = 0
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+            update(workers)
+        elapsed = time.perf_counter() - start
+        summary = metrics.snapshot()
+        failures = journaled_failures(os.path.join(journal.JOURNAL_DIR, 'update.jsonl'))
+
+    return {
+        'rows': rows,
+        'workers': workers,
+        'cache': cache,
+        'backend': backend,
+        'engine': engine,
+        'parse_workers': parse_workers,
+        'elapsed': elapsed,
+        'books_per_minute': rows / elapsed * 60 if elapsed else 0.0,
+        'stages': {stage: summary['stages'].get(stage, {}).get('total', 0.0) for stage in STAGES},
+        'counts': {stage: summary['stages'].get(stage, {}).get('calls', 0) for stage in STAGES},
+        'peak_bytes': peak_rss_bytes(),
+        'requests': site.requests,
+        'rate_limited': notion.calls['rate_limited'],
+        'failed': failures,
+    }
+
+def journaled_failures(path):
+    # Pages the run journaled as failed
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for line in f if json.loads(line)['outcome'] == 'failed')
+
+# Printed under the results when benchmarks/fixtures/ holds no recorded pages, as in a fresh checkout
+SYNTHETIC_ONLY = ("Results are from synthetic Goodreads pages only, which cannot show parser or backend differences "
+                  "on real markup; record real pages with --record BOOK_ID ... to replay them instead.")
+
+def print_results(results):
+    header = f"{'rows':>6} {'engine':>6} {'workers':>7} {'procs':>5} {'cache':>5} {'parser':>8} {'books/min':>10} " \
+             f"{'fetch s':>8} {'parse s':>8} {'clean s':>8} {'write s':>8} {'peak MB':>8} {'429s':>5} {'failed':>6}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        stages = r['stages']
+        # parse_book_page calls process_summary, so report parsing without the cleanup time
+        parse_only = stages['parse'] - stages['clean']
+        peak = f"{r['peak_bytes'] / 1e6:8.1f}" if r['peak_bytes'] is not None else f"{'-':>8}"
+        print(f"{r['rows']:>6} {r['engine']:>6} {r['workers']:>7} {r['parse_workers']:>5} {r['cache']:>5} {r['backend']:>8} {r['books_per_minute']:>10.0f} "
+              f"{stages['fetch']:>8.2f} {parse_only:>8.2f} {stages['clean']:>8.2f} {stages['write']:>8.2f} "
+              f"{peak} {r['rate_limited']:>5} {r['failed']:>6}")
+
+def record_fixtures(book_ids, directory=fakes.FIXTURES_DIR):
+    """
+    Download live Goodreads book pages into the fixtures directory for later replay.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for book_id in book_ids:
+        rate_limiter.acquire(rate_limiter.GOODREADS_HOST)
+        response = http_client.get('https://www.goodreads.com/book/show/' + book_id)
+        if response.status_code != 200:
+            print(f"Failed to record {book_id}: HTTP {response.status_code}")
+            continue
+        path = os.path.join(directory, f'{book_id}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"Recorded {path} ({len(response.text)} bytes)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the --update pipeline.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000], help='Synthetic database sizes to run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8],
+                        help='Worker counts (or, for the async engine, requests in flight) to compare')
+    parser.add_argument('--engine', choices=['sync', 'async'], nargs='+', default=['sync'], help='Engines to compare')
+    parser.add_argument('--parse-workers', type=int, nargs='+', default=[0],
+                        help='Parse pool sizes to compare (0 parses in the fetching threads)')
+    parser.add_argument('--cache', choices=['off', 'cold', 'warm'], nargs='+', default=['off'], help='HTTP cache modes to compare')
+    parser.add_argument('--parser', choices=sorted(book_parser.BACKENDS), nargs='+', default=[book_parser.DEFAULT_BACKEND],
+                        help='Parser backends to compare')
+    parser.add_argument('--notion-latency', type=float, default=0.0, help='Seconds added to every fake Notion call')
+    parser.add_argument('--goodreads-latency', type=float, default=0.0, help='Seconds added to every fake Goodreads request')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of Notion calls answered with a 429')
+    parser.add_argument('--rate-limits', action='store_true', help='Keep the real per-host rate limits instead of lifting them')
+    parser.add_argument('--record', nargs='+', metavar='BOOK_ID', help='Record live Goodreads pages as fixtures and exit')
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record)
+        return
+
+    fixtures = len(fakes.load_fixtures())
+    print(f"Replaying {fixtures} recorded page(s)" if fixtures else "No recorded fixtures; using synthetic pages")
+
+    results = []
+    for rows, engine, workers, parse_workers, cache, backend in itertools.product(
+            args.rows, args.engine, args.workers, args.parse_workers, args.cache, args.parser):
+        # A fresh process per run keeps the peak memory figures independent
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_update, rows, workers, cache, backend, args.notion_latency,
+                                           args.goodreads_latency, args.rate_limit_rate, args.rate_limits,
+                                           engine, parse_workers).result())
+    print_results(results)
+    if not fixtures:
+        print(SYNTHETIC_ONLY)
+
+    # Every page should get through, including those whose Goodreads page lacks optional fields
+    if any(r['failed'] for r in results):
+        print("Some pages failed; see the 'failed' column")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Check how the resolver memo remembers matches: weak matches are not remembered, confident
+ones are, and a --fix_match correction replaces a wrong confident match for the title so a
+later --get_new finds the corrected book. Then time title resolution against a warm memo.
+Goodreads searches are answered offline. Run from the Code directory:
+
+    python -m benchmarks.bench_resolver [--titles 5000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+from benchmarks import fakes  # noqa: F401  (stubs config for the resolver's imports)
+import resolver
+
+# Search results served for every title: the same wrong book each time, as when Goodreads
+# ranks another edition or a namesake first
+WRONG_RESULT = {'id': '111', 'title': 'Dune', 'author': 'Wrong Person'}
+
+def fake_search_results(title, limit=resolver.SEARCH_RESULTS):
+    return [dict(WRONG_RESULT, title=title)]
+
+def check_flows():
+    """
+    Return a list of descriptions of the memo flows that misbehave.
+    """
+    problems = []
+    memo = resolver.get_memo()
+
+    weak = resolver.best_match(resolver.match_key('Dune', 'Frank Herbert'),
+                               [{'id': '222', 'title': 'Dune Messiah', 'author': 'Someone Else'}])
+    if weak['confidence'] >= resolver.MIN_CONFIDENCE:
+        problems.append(f"expected a weak match, got confidence {weak['confidence']}")
+    if memo.lookup(resolver.match_key('Dune', 'Frank Herbert')) is not None:
+        problems.append("a match below MIN_CONFIDENCE was remembered")
+
+    # --get_new on a title-only entry remembers the wrong book with full confidence, as it
+    # does for an entry that already carries the wrong book's author
+    first = resolver.resolve_title('Dune', '')
+    resolver.resolve_title('Dune', 'Wrong Person')
+    if first['id'] != '111' or memo.lookup(resolver.match_key('Dune', '')) is None:
+        problems.append("a confident match was not remembered")
+
+    # --fix_match reads back the wrong author that was written onto the page; the correction
+    # must still win for the title-only entry and for the right author
+    packet = SimpleNamespace(title='Dune', author='Frank Herbert')
+    resolver.correct_choice('Dune', '234225', packet)
+    for author in ('', 'Frank Herbert'):
+        resolution = resolver.resolve_title('Dune', author)
+        if resolution['id'] != '234225':
+            problems.append(f"after --fix_match, Dune by {author!r} still resolves to {resolution['id']}")
+    if memo.lookup(resolver.match_key('Dune', 'Wrong Person')) is not None:
+        problems.append("the wrong match is still remembered under the author it wrote")
+
+    # --review remembers the choice under the entry's own title and author
+    resolver.remember_choice('Emma', 'Jane Austen', '6969', SimpleNamespace(title='Emma', author='Jane Austen'))
+    if resolver.resolve_title('Emma', 'Jane Austen')['id'] != '6969':
+        problems.append("a --review choice was not remembered")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the resolver memo flows and time warm lookups.')
+    parser.add_argument('--titles', type=int, default=5000, help='Distinct titles to resolve for the timing')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='bookdb-resolver-')
+    search_results = resolver.search_results
+    resolver.search_results = fake_search_results
+    resolver._memo = resolver.ResolverMemo(os.path.join(scratch, 'resolver.sqlite'))
+    try:
+        problems = check_flows()
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(1)
+        print("Weak matches are not remembered and --fix_match corrections replace wrong ones")
+
+        entries = [(f"Synthetic Book {i}", '') for i in range(args.titles)]
+        resolver.resolve_titles(entries)
+        start = time.perf_counter()
+        resolver.resolve_titles(entries)
+        elapsed = time.perf_counter() - start
+        print(f"Warm memo: {args.titles / elapsed:.0f} titles/s")
+    finally:
+        resolver.search_results = search_results
+        resolver._memo.conn.close()
+        resolver._memo = None
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
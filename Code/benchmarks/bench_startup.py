@@ -0,0 +1,141 @@
+"""
+Check that main.py starts quickly: parsing arguments must not import the scraping or Notion
+stacks, nor must applying the options of commands that do not use them or answering --query
+from an index on disk; importing notion_api must not build a client, and `python main.py
+--help` must stay within a time budget over a bare interpreter. Exits non-zero when any check fails, so it can
+run in CI. Run from the Code directory:
+
+    python -m benchmarks.bench_startup [--budget-ms 100] [--runs 7]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules that only the commands themselves need
+HEAVY_MODULES = ['IPython', 'bs4', 'httpx', 'lxml', 'notion_client', 'requests', 'tqdm',
+                 'async_engine', 'goodreads', 'notion_api', 'rate_limiter']
+
+PARSE_ARGUMENTS = """
+import json, sys
+import main
+main.build_parser().parse_args(['--update', '--workers', '4'])
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))
+"""
+
+# Runs main() on the given arguments in the given directory, replacing every command with a
+# no-op unless `run` is set, and lists the heavy modules that were loaded
+RUN_COMMAND = """
+import json, os, sys
+sys.path.insert(0, os.getcwd())
+os.chdir({directory!r})
+import main
+sys.argv = ['main.py'] + {arguments!r}
+if not {run!r}:
+    main.COMMANDS = [(name, lambda args: None) for name, _ in main.COMMANDS]
+main.main()
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))
+"""
+
+# Commands and the heavy modules they may load. With run=False only the options are applied
+# (the command itself would reach Notion); a --query runs for real against a prebuilt index.
+COMMAND_CASES = [
+    (['--query', 'genre=Fantasy pages<400'], True, []),
+    (['--export', 'books.csv', '--workers', '4', '--profile'], False, []),
+    (['--import', 'books.parquet', '--workers', '4', '--fixed_rates'], False, ['rate_limiter']),
+    (['--update', '--workers', '4', '--no_cache', '--timeout', '5'], False, ['requests', 'rate_limiter']),
+]
+
+IMPORT_NOTION_API = """
+from benchmarks import fakes
+import notion_api
+print(notion_api.notion_client is None)
+"""
+
+def run_child(code):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+def build_sample_index(directory, pages=200):
+    # Built here, so the child answering --query finds an index and needs no Notion access
+    from benchmarks import fakes
+    import book_index
+    book_index.build_index((fakes.synthetic_page(i) for i in range(pages)),
+                           os.path.join(directory, book_index.INDEX_PATH))
+
+def check_commands():
+    """
+    Return True if every command in COMMAND_CASES loads only the heavy modules it is allowed.
+    """
+    directory = tempfile.mkdtemp(prefix='bookdb-startup-')
+    ok = True
+    try:
+        build_sample_index(directory)
+        for arguments, run, allowed in COMMAND_CASES:
+            code = RUN_COMMAND.format(directory=directory, arguments=arguments, run=run, heavy=HEAVY_MODULES)
+            try:
+                loaded = json.loads(run_child(code).splitlines()[-1])
+            except subprocess.CalledProcessError as e:
+                print(f"main.py {' '.join(arguments)} failed: {(e.stderr.strip().splitlines() or [''])[-1]}")
+                ok = False
+                continue
+            extra = [name for name in loaded if name not in allowed]
+            if extra:
+                print(f"main.py {' '.join(arguments)} imported: {', '.join(extra)}")
+                ok = False
+            else:
+                print(f"main.py {' '.join(arguments)} imports only what it uses")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return ok
+
+def median_seconds(command, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import-time budget of main.py.')
+    parser.add_argument('--budget-ms', type=float, default=100.0,
+                        help='Allowed median time of `main.py --help` over a bare interpreter')
+    parser.add_argument('--runs', type=int, default=7, help='Runs of each command to take the median of')
+    args = parser.parse_args()
+    failed = False
+
+    loaded = json.loads(run_child(PARSE_ARGUMENTS.format(heavy=HEAVY_MODULES)))
+    if loaded:
+        print(f"Parsing arguments imported: {', '.join(loaded)}")
+        failed = True
+    else:
+        print("Parsing arguments imports none of the command modules")
+
+    if not check_commands():
+        failed = True
+
+    if run_child(IMPORT_NOTION_API) != 'True':
+        print("Importing notion_api created a Notion client")
+        failed = True
+    else:
+        print("Importing notion_api does not create a Notion client")
+
+    baseline = median_seconds([sys.executable, '-c', 'pass'], args.runs)
+    startup = median_seconds([sys.executable, 'main.py', '--help'], args.runs)
+    overhead_ms = (startup - baseline) * 1000
+    print(f"main.py --help: {startup * 1000:.0f} ms, {overhead_ms:.0f} ms over a bare interpreter "
+          f"(budget {args.budget_ms:.0f} ms)")
+    if overhead_ms > args.budget_ms:
+        failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
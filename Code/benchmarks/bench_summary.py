@@ -0,0 +1,61 @@
+"""
+Check process_summary against the golden corpus and compare its throughput with the
+legacy implementation. Run from the Code directory:
+
+    python -m benchmarks.bench_summary [--seconds 2]
+"""
+import argparse
+import json
+import os
+import time
+import utilities
+from benchmarks import legacy_utilities
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'summary_corpus.jsonl')
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def check_golden(corpus):
+    """
+    Return the corpus entries for which either implementation no longer matches the golden output.
+    """
+    mismatches = []
+    for i, entry in enumerate(corpus):
+        for name, process in (('legacy', legacy_utilities.process_summary), ('current', utilities.process_summary)):
+            output = process(entry['input'])
+            if output != entry['expected']:
+                mismatches.append((i, name, output))
+    return mismatches
+
+def summaries_per_second(process, summaries, seconds):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for summary in summaries:
+            process(summary)
+        count += len(summaries)
+    return count / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark process_summary against the legacy implementation.')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time spent timing each implementation')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    mismatches = check_golden(corpus)
+    for i, name, output in mismatches:
+        print(f"Golden mismatch in entry {i} ({name}): {output!r}")
+    if mismatches:
+        raise SystemExit(1)
+    print(f"All {len(corpus)} golden summaries match")
+
+    summaries = [entry['input'] for entry in corpus]
+    legacy = summaries_per_second(legacy_utilities.process_summary, summaries, args.seconds)
+    current = summaries_per_second(utilities.process_summary, summaries, args.seconds)
+    print(f"legacy:  {legacy:10.0f} summaries/s")
+    print(f"current: {current:10.0f} summaries/s ({current / legacy:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Offline stand-ins for Notion and Goodreads used by the benchmarks: a synthetic book
+database behind a fake notion_client.Client, and Goodreads pages replayed from recorded
+fixtures (or generated when none have been recorded).
+"""
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# notion_api reads its credentials from config.py, which is not part of the repository
+if 'config' not in sys.modules:
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        sys.modules['config'] = types.SimpleNamespace(NOTION_TOKEN='offline', DATABASE_ID='offline-database')
+
+from notion_client import APIResponseError
+
+GENRES = ['Fantasy', 'Fiction', 'Science Fiction', 'Classics', 'Mystery', 'Romance', 'Historical Fiction', 'Nonfiction']
+
+class RateLimited(APIResponseError):
+    """
+    A 429 from the fake Notion API, built without an HTTP response object.
+    """
+    def __init__(self):
+        Exception.__init__(self, "Rate limited")
+        self.status = 429
+        self.code = 'rate_limited'
+        self.headers = {'Retry-After': '1'}
+
+def synthetic_page(i, with_id=True):
+    """
+    A Notion page object shaped like the ones in the book database. Even rows already hold
+    the rating values their synthetic Goodreads page will show, so a refresh leaves them alone.
+    """
+    n = 1000 + i
+    rating = float(f"4.{n % 100:02d}") if i % 2 == 0 else 4.0
+    num_ratings = 1000 + n * 3 if i % 2 == 0 else 0
+    return {
+        "id": f"page-{i:06d}",
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            "Name": {"title": [{"text": {"content": f"Synthetic Book {i}"}}]},
+            "ID": {"rich_text": [{"text": {"content": str(n)}}] if with_id else []},
+            "Author": {"rich_text": [{"text": {"content": f"Author {i % 97}"}}]},
+            "Goodreads Rating": {"number": rating},
+            "Number of Ratings": {"number": num_ratings},
+            "Page Count": {"number": 100 + i % 900},
+            "Genres": {"multi_select": [{"name": GENRES[i % len(GENRES)]}]},
+            "Series": {"rich_text": []},
+        },
+    }
+
+class FakeNotionClient:
+    """
+    Serves a synthetic database of `rows` pages through the databases.query/retrieve and
+    pages.update calls the tool makes. Every call sleeps for `latency` seconds, and a
+    fraction `rate_limit_rate` of calls raise a 429 instead.
+    """
+    def __init__(self, rows, latency=0.0, rate_limit_rate=0.0, seed=0):
+        self.rows = [synthetic_page(i) for i in range(rows)]
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {'query': 0, 'retrieve': 0, 'update': 0, 'rate_limited': 0}
+        self.databases = types.SimpleNamespace(query=self.query, retrieve=self.retrieve)
+        self.pages = types.SimpleNamespace(update=self.update)
+
+    def call(self, kind):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls[kind] += 1
+            if self.rate_limit_rate and self.random.random() < self.rate_limit_rate:
+                self.calls['rate_limited'] += 1
+                raise RateLimited()
+
+    def query(self, database_id, filter=None, page_size=100, start_cursor=None, filter_properties=None):
+        self.call('query')
+        rows = self.rows
+        if filter == {"property": "ID", "rich_text": {"is_empty": True}}:
+            rows = [page for page in rows if not page["properties"]["ID"]["rich_text"]]
+        elif filter == {"property": "ID", "rich_text": {"is_not_empty": True}}:
+            rows = [page for page in rows if page["properties"]["ID"]["rich_text"]]
+        start = int(start_cursor or 0)
+        end = start + page_size
+        return {"results": rows[start:end], "has_more": end < len(rows), "next_cursor": str(end) if end < len(rows) else None}
+
+    def retrieve(self, database_id):
+        self.call('retrieve')
+        return {"properties": {"Genres": {"type": "multi_select", "multi_select": {"options": [{"name": g} for g in GENRES]}}}}
+
+    def update(self, page_id, **payload):
+        self.call('update')
+        return {"id": page_id}
+
+class AsyncFakeNotionClient:
+    """
+    notion_client.AsyncClient stand-in over a FakeNotionClient (which should have no latency
+    of its own); each call awaits `latency` seconds without blocking the event loop.
+    """
+    def __init__(self, client, latency=0.0):
+        self.client = client
+        self.latency = latency
+        self.databases = types.SimpleNamespace(query=self.wrap(client.query), retrieve=self.wrap(client.retrieve))
+        self.pages = types.SimpleNamespace(update=self.wrap(client.update))
+
+    def wrap(self, function):
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self.latency)
+            return function(*args, **kwargs)
+        return call
+
+    async def aclose(self):
+        pass
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.status_code = status_code
+        self.headers = {}
+
+# Markup the scraper never reads, standing in for the bulk of a real page (reviews, navigation)
+NOISE = ''.join(
+    f'<div class="ReviewCard"><div class="ReviewerProfile"><a href="/user/show/{i}">Reader {i}</a></div>'
+    f'<section class="ReviewText"><span class="Formatted">Review text number {i}, with some thoughts.</span></section></div>'
+    for i in range(300)
+)
+
+# Every this many books, the synthetic page has no page count, like some audiobook and ebook editions
+NO_PAGE_COUNT_EVERY = 10
+
+def synthetic_book_page(book_id, json_ld=False):
+    """
+    Synthetic Goodreads book page carrying every element scrape_book_info reads, padded
+    with review markup so parsing costs something like a real page. Every
+    NO_PAGE_COUNT_EVERY-th book has no pagesFormat element. With json_ld, the page also
+    embeds the JSON-LD payload real pages carry, agreeing with its markup.
+    """
+    n = int(book_id) if book_id.isdigit() else 0
+    has_page_count = n % NO_PAGE_COUNT_EVERY != NO_PAGE_COUNT_EVERY - 1
+    summary = ("A sweeping story of ambition and loss.It begins in a small town.\"Nothing lasts,\"she said. " * 12)
+    genres = ''.join(f'<span class="Button__labelItem">{g}</span>' for g in GENRES[:4]) + '<span class="Button__labelItem">...more</span>'
+    page_count = f'<p data-testid="pagesFormat">{100 + n % 900} pages, Hardcover</p>' if has_page_count else ''
+    script = ''
+    if json_ld:
+        payload = {
+            '@type': 'Book',
+            'name': f'Synthetic Book {n}',
+            'image': f'https://images.example.com/covers/{n}.jpg',
+            'aggregateRating': {'ratingValue': float(f'4.{n % 100:02d}'), 'ratingCount': 1000 + n * 3},
+        }
+        if has_page_count:
+            payload['numberOfPages'] = 100 + n % 900
+        script = f'<script type="application/ld+json">{json.dumps(payload)}</script>'
+    return f"""<html><head><title>Book {n}</title>{script}</head><body>
+<div class="BookPage__gridContainer">
+<img class="ResponsiveImage" src="https://images.example.com/covers/{n}.jpg">
+<h1 data-testid="bookTitle">Synthetic Book {n}</h1>
+<h3 class="Text Text__title3 Text__italic Text__regular Text__subdued">Synthetic Series #{n % 5 + 1}</h3>
+<span data-testid="name">Author {n % 97}</span>
+<div class="RatingStatistics__rating">4.{n % 100:02d}</div>
+<span data-testid="ratingsCount">{1000 + n * 3:,}<span>&nbsp;ratings</span></span>
+<div class="DetailsLayoutRightParagraph__widthConstrained"><span>{summary}</span></div>
+<div data-testid="genresList">{genres}</div>
+{page_count}
+<p data-testid="publicationInfo">First published March {n % 28 + 1}, {1950 + n % 70}</p>
+{NOISE}
+</div></body></html>"""
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """
+    Recorded Goodreads book pages, saved by `bench_pipeline --record`.
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+class FakeGoodreads:
+    """
+    Replacement for http_client.get that replays fixture pages (cycling through them) or,
+    without fixtures, serves synthetic pages, after sleeping for `latency` seconds.
+    """
+    def __init__(self, latency=0.0, fixtures=None):
+        self.latency = latency
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def get(self, url, headers=None):
+        time.sleep(self.latency)
+        book_id = url.rstrip('/').split('/')[-1]
+        if self.fixtures:
+            index = int(book_id) if book_id.isdigit() else 0
+            text = self.fixtures[index % len(self.fixtures)]
+        else:
+            text = synthetic_book_page(book_id)
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(text)
+        return FakeResponse(text)
+
+class AsyncFakeGoodreads:
+    """
+    httpx.AsyncClient stand-in over a FakeGoodreads (which should have no latency of its
+    own); each request awaits `latency` seconds without blocking the event loop.
+    """
+    def __init__(self, site, latency=0.0):
+        self.site = site
+        self.latency = latency
+
+    async def get(self, url, headers=None):
+        await asyncio.sleep(self.latency)
+        return self.site.get(url, headers)
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,281 @@
+import json
+import math
+import mmap
+import os
+import re
+import shlex
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+INDEX_PATH = os.path.join('.bookdb', 'book_index.bin')
+
+MAGIC = b'BOOKIDX1'
+# Magic, then the length of the JSON header that follows it
+PREAMBLE = struct.Struct('<8sI')
+
+# Fields with an inverted index (term -> page numbers), and the query names they answer to
+TERM_FIELDS = {'genre': 'genres', 'genres': 'genres', 'series': 'series', 'author': 'author'}
+# Fields with a sorted index for range queries, and the query names they answer to
+RANGE_FIELDS = {'pages': 'pages', 'rating': 'rating', 'ratings': 'num_ratings'}
+# Select, status and checkbox properties are indexed too, under their lower-cased name
+OPTION_TYPES = ('select', 'status', 'checkbox')
+
+SERIES_NUMBER = re.compile(r'\s*#\s*([\d.]+)\S*\s*$')
+WHITESPACE = re.compile(r'\s+')
+CONDITION = re.compile(r'^([A-Za-z_ ]+?)\s*(<=|>=|!=|=|<|>)\s*(.+)$')
+
+def term_key(value):
+    return WHITESPACE.sub(' ', str(value)).strip().casefold()
+
+def split_series(series):
+    # "The Expanse #3" -> ('the expanse', 3.0); a series without a number gets NaN
+    match = SERIES_NUMBER.search(series)
+    if match is None:
+        return term_key(series), math.nan
+    try:
+        number = float(match.group(1))
+    except ValueError:
+        number = math.nan
+    return term_key(series[:match.start()]), number
+
+def option_terms(page):
+    # (field, value) for every select, status and checkbox property of a page
+    for name, prop in page.get("properties", {}).items():
+        kind = prop.get("type")
+        if kind not in OPTION_TYPES:
+            continue
+        value = prop.get(kind)
+        if kind == 'checkbox':
+            yield term_key(name), str(bool(value)).lower()
+        elif value:
+            yield term_key(name), term_key(value.get("name", ''))
+
+def build_index(pages, path=INDEX_PATH):
+    """
+    Build the index from one pass over `pages` (e.g. mirror.database_pages()) and write it
+    to `path`. Each page gets a number; the file holds, for each genre, series, author and
+    select-like property value, the sorted numbers of the pages that have it, and for each
+    numeric field the values in ascending order alongside the matching page numbers. Only
+    these arrays and a short text line per page are kept in memory while building.
+    Returns the number of pages indexed.
+    """
+    # Only needed to build; answering queries imports nothing beyond the standard library
+    from bulk_io import page_to_row
+
+    terms = {}
+    numbers = {field: [] for field in RANGE_FIELDS.values()}
+    columns = {field: array('d') for field in list(RANGE_FIELDS.values()) + ['series_number']}
+    lines = bytearray()
+    line_offsets = array('I', [0])
+    count = 0
+
+    for number, page in enumerate(pages):
+        row = page_to_row(page)
+        for genre in row['genres']:
+            terms.setdefault('genres', {}).setdefault(term_key(genre), array('I')).append(number)
+        series_number = math.nan
+        if row['series']:
+            series, series_number = split_series(row['series'])
+            terms.setdefault('series', {}).setdefault(series, array('I')).append(number)
+        if row['author']:
+            terms.setdefault('author', {}).setdefault(term_key(row['author']), array('I')).append(number)
+        for field, value in option_terms(page):
+            terms.setdefault(field, {}).setdefault(value, array('I')).append(number)
+        for field in RANGE_FIELDS.values():
+            value = row[field]
+            columns[field].append(math.nan if value is None else float(value))
+            if value is not None:
+                numbers[field].append((float(value), number))
+        columns['series_number'].append(series_number)
+
+        fields = (row['title'] or '', row['author'] or '', row['series'] or '', page['id'])
+        lines += '\t'.join(field.replace('\t', ' ') for field in fields).encode('utf-8')
+        line_offsets.append(len(lines))
+        count = number + 1
+
+    # Lay the arrays out one after another, each starting on an 8-byte boundary
+    blobs = []
+    size = 0
+
+    def place(data):
+        nonlocal size
+        data = bytes(data)
+        offset = size
+        padding = -len(data) % 8
+        blobs.append(data + b'\0' * padding)
+        size += len(data) + padding
+        return offset
+
+    header = {'count': count, 'built_at': time.time(), 'terms': {}, 'ranges': {}, 'columns': {}}
+    for field, values in terms.items():
+        header['terms'][field] = {value: [place(ids), len(ids)] for value, ids in sorted(values.items())}
+    for field, pairs in numbers.items():
+        pairs.sort()
+        header['ranges'][field] = [place(array('d', (value for value, _ in pairs))),
+                                   place(array('I', (number for _, number in pairs))), len(pairs)]
+    for field, values in columns.items():
+        header['columns'][field] = place(values)
+    header['lines'] = [place(line_offsets), place(lines)]
+
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-(PREAMBLE.size + len(encoded)) % 8)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = path + '.partial'
+    with open(partial, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, len(encoded)))
+        f.write(encoded)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(partial, path)
+    return count
+
+class BookIndex:
+    """
+    Read-only view of an index file written by build_index(). The file is memory-mapped, so
+    opening it costs one read of the JSON header; posting lists, sorted values and page
+    lines are read straight from the mapping as they are used.
+    """
+    def __init__(self, path=INDEX_PATH):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = PREAMBLE.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a book index")
+        self.base = PREAMBLE.size + header_size
+        self.header = json.loads(self.map[PREAMBLE.size:self.base])
+        self.count = self.header['count']
+        self.view = memoryview(self.map)
+
+    def array(self, offset, length, typecode):
+        start = self.base + offset
+        return self.view[start:start + length * struct.calcsize(typecode)].cast(typecode)
+
+    def postings(self, field, value):
+        # Sorted page numbers having `value` in `field`
+        entry = self.header['terms'].get(field, {}).get(term_key(value))
+        if entry is None:
+            return []
+        return self.array(entry[0], entry[1], 'I')
+
+    def between(self, field, low=-math.inf, high=math.inf, include_low=True, include_high=True):
+        # Page numbers whose `field` lies between low and high
+        values_offset, ids_offset, length = self.header['ranges'][field]
+        values = self.array(values_offset, length, 'd')
+        start = bisect_left(values, low) if include_low else bisect_right(values, low)
+        end = bisect_right(values, high) if include_high else bisect_left(values, high)
+        return self.array(ids_offset, length, 'I')[start:end]
+
+    def column(self, field, number):
+        return self.array(self.header['columns'][field], self.count, 'd')[number]
+
+    def document(self, number):
+        offsets_offset, lines_offset = self.header['lines']
+        offsets = self.array(offsets_offset, self.count + 1, 'I')
+        start = self.base + lines_offset
+        title, author, series, page_id = bytes(self.view[start + offsets[number]:start + offsets[number + 1]]).decode('utf-8').split('\t')
+        document = {'title': title, 'author': author, 'series': series, 'page_id': page_id}
+        for field in RANGE_FIELDS.values():
+            value = self.column(field, number)
+            document[field] = None if math.isnan(value) else value
+        return document
+
+    def matches(self, field, operator, value):
+        """
+        Page numbers satisfying one condition. `value` may list alternatives separated by '|'.
+        """
+        if field in RANGE_FIELDS:
+            field = RANGE_FIELDS[field]
+            number = float(value)
+            if operator == '=':
+                return set(self.between(field, number, number))
+            if operator == '!=':
+                return set(range(self.count)) - set(self.between(field, number, number))
+            low, high = (number, math.inf) if operator in ('>', '>=') else (-math.inf, number)
+            return set(self.between(field, low, high, include_low=operator != '>', include_high=operator != '<'))
+        field = TERM_FIELDS.get(field, field)
+        if field not in self.header['terms']:
+            raise ValueError(f"no indexed field {field!r}")
+        if operator not in ('=', '!='):
+            raise ValueError(f"{field} only supports = and !=")
+        numbers = set()
+        for alternative in value.split('|'):
+            key = split_series(alternative)[0] if field == 'series' else alternative
+            numbers.update(self.postings(field, key))
+        return numbers if operator == '=' else set(range(self.count)) - numbers
+
+    def query(self, conditions):
+        """
+        Page numbers matching every (field, operator, value) condition, smallest set first.
+        """
+        result = None
+        for sets in sorted((self.matches(*condition) for condition in conditions), key=len):
+            result = sets if result is None else result & sets
+            if not result:
+                break
+        return set(range(self.count)) if result is None else result
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+def parse_query(text):
+    """
+    Split a query such as `genre=fantasy pages<400 "series=The Expanse"` into
+    (field, operator, value) conditions.
+    """
+    conditions = []
+    for part in shlex.split(text):
+        match = CONDITION.match(part)
+        if match is None:
+            raise ValueError(f"cannot read condition {part!r}; use field=value or field<number")
+        conditions.append((term_key(match.group(1)), match.group(2), match.group(3).strip()))
+    return conditions
+
+def ordered(index, numbers, conditions):
+    # Books of a queried series in series order, anything else by title
+    if any(field == 'series' for field, _, _ in conditions):
+        def key(number):
+            position = index.column('series_number', number)
+            return (math.isnan(position), position, index.document(number)['title'].casefold())
+    else:
+        def key(number):
+            return index.document(number)['title'].casefold()
+    return sorted(numbers, key=key)
+
+def query_books(text, path=INDEX_PATH, rebuild=False):
+    """
+    Answer a query from the local index, building the index from the database first if it
+    does not exist yet or rebuild is set, and print the matching books.
+    """
+    try:
+        if rebuild or not os.path.exists(path):
+            from mirror import database_pages
+            print('Indexing the database...')
+            print(f"Indexed {build_index(database_pages(), path)} page(s)")
+        if not text:
+            return
+        start = time.perf_counter()
+        conditions = parse_query(text)
+        index = BookIndex(path)
+        try:
+            numbers = ordered(index, index.query(conditions), conditions)
+            documents = [index.document(number) for number in numbers]
+        finally:
+            index.close()
+        elapsed = (time.perf_counter() - start) * 1000
+        for document in documents:
+            details = [document['author']]
+            if document['series']:
+                details.append(document['series'])
+            if document['pages'] is not None:
+                details.append(f"{document['pages']:.0f} pages")
+            if document['rating'] is not None:
+                details.append(f"rated {document['rating']:g}")
+            print(f"{document['title']} ({', '.join(detail for detail in details if detail)})")
+        print(f"{len(documents)} book(s) in {elapsed:.1f} ms")
+    except Exception as e:
+        print(f"An error occurred: {e}")
@@ -0,0 +1,106 @@
+import re
+from datetime import date
+from utilities import parse_date_result
+
+FULL_DATE = re.compile(r'[A-Z][a-z]+ \d{1,2}, \d{4}')
+YEAR = re.compile(r'\b(\d{4})\b')
+NON_DIGIT = re.compile(r'\D')
+
+def parse_number(value, kind, book_id, required=True):
+    """
+    Read an integer shown on a Goodreads page ("1,234", "352 pages") or already converted.
+    Raises ValueError naming the book and field when a required value is missing or malformed.
+    """
+    if isinstance(value, int):
+        return value
+    digits = NON_DIGIT.sub('', value.split(' ')[0]) if isinstance(value, str) else ''
+    if digits:
+        return int(digits)
+    if required:
+        raise ValueError(f"Goodreads ID #{book_id}: malformed {kind} {value!r}")
+    return None
+
+def parse_rating(value, book_id):
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        raise ValueError(f"Goodreads ID #{book_id}: malformed rating {value!r}") from None
+
+def parse_publication_date(text):
+    """
+    Date from Goodreads publication info such as "First published March 21, 1970" or
+    "Published 1970 by Tor"; only the year is kept when that is all the page gives,
+    and None is returned when there is no date at all.
+    """
+    if isinstance(text, date):
+        return text
+    match = FULL_DATE.search(text or '')
+    if match is not None:
+        parsed = parse_date_result(match.group(0))
+        if parsed.precision == 'day':
+            return parsed.value.date()
+    match = YEAR.search(text or '')
+    if match is not None:
+        return date(int(match.group(1)), 1, 1)
+    return None
+
+class BookMetadata:
+    """
+    Metadata scraped for one Goodreads book, with numbers and dates converted once when it is
+    built: rating is a float, num_ratings and pages are ints (pages may be None) and
+    publication_date is a datetime.date (or None). to_compact() gives a JSON-ready list that
+    from_compact() reads back.
+    """
+    __slots__ = ('pid', 'title', 'author', 'sort_author', 'series', 'rating', 'num_ratings', 'pages',
+                 'publication_date', 'summary', 'genres', 'cover')
+
+    def __init__(self, pid, title, author, sort_author=None, series=None, rating=None, num_ratings=None, pages=None,
+                 publication_date=None, summary=None, genres=(), cover=None):
+        self.pid = pid
+        self.title = title
+        self.author = author
+        self.sort_author = sort_author
+        self.series = series
+        self.rating = rating
+        self.num_ratings = num_ratings
+        self.pages = pages
+        self.publication_date = publication_date
+        self.summary = summary
+        self.genres = tuple(genres)
+        self.cover = cover
+
+    @classmethod
+    def from_scraped(cls, pid, title, author, sort_author, series, rating, num_ratings, pages, publication_date,
+                     summary, genres, cover):
+        """
+        Build the record from values as they appear on the page. A malformed rating or
+        ratings count raises ValueError; a missing page count or date becomes None.
+        """
+        return cls(pid, title, author, sort_author, series,
+                   parse_rating(rating, pid),
+                   parse_number(num_ratings, 'ratings count', pid),
+                   parse_number(pages, 'page count', pid, required=False),
+                   parse_publication_date(publication_date),
+                   summary, genres, cover)
+
+    def to_compact(self):
+        values = [getattr(self, name) for name in self.__slots__]
+        if self.publication_date is not None:
+            values[self.__slots__.index('publication_date')] = self.publication_date.isoformat()
+        values[self.__slots__.index('genres')] = list(self.genres)
+        return values
+
+    @classmethod
+    def from_compact(cls, values):
+        record = cls(*values)
+        if record.publication_date is not None:
+            record.publication_date = date.fromisoformat(record.publication_date)
+        return record
+
+    def __eq__(self, other):
+        if not isinstance(other, BookMetadata):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"BookMetadata(pid={self.pid!r}, title={self.title!r}, author={self.author!r})"
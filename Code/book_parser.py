@@ -0,0 +1,232 @@
+import json
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+import metrics
+from book_metadata import BookMetadata
+from utilities import process_summary, format_name
+
+try:
+    import lxml  # noqa: F401
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Parser backends: the BeautifulSoup tree builder to use, and whether to build only the
+# elements the scraper reads. 'soup' is the original full html.parser tree and is always
+# used as the fallback when a targeted parse comes up short.
+BACKENDS = {
+    'soup': ('html.parser', False),
+    'strained': ('html.parser', True),
+    'lxml': ('lxml', True),
+}
+DEFAULT_BACKEND = 'lxml' if LXML_AVAILABLE else 'strained'
+
+# Backend used when none is passed explicitly; main.py sets this from --parser
+PARSER_BACKEND = DEFAULT_BACKEND
+
+JSON_LD_PATTERN = re.compile(r'<script type="application/ld\+json">(.*?)</script>', re.S)
+
+# data-testid values and classes of the book page elements that scrape_book_info reads
+BOOK_TEST_IDS = {'bookTitle', 'name', 'publicationInfo', 'ratingsCount', 'pagesFormat', 'genresList'}
+BOOK_CLASSES = {'RatingStatistics__rating', 'DetailsLayoutRightParagraph__widthConstrained', 'ResponsiveImage'}
+SERIES_CLASSES = {'Text__title3', 'Text__italic'}
+
+def tag_classes(attrs):
+    # Depending on the bs4 version and tree builder, class may still be the raw attribute string
+    classes = attrs.get('class') or []
+    return set(classes.split() if isinstance(classes, str) else classes)
+
+class TargetedStrainer(SoupStrainer):
+    """
+    SoupStrainer that builds only the tags for which wanted(name, attrs) is true, along with
+    everything inside them. bs4 4.13+ asks allow_tag_creation() while parsing; earlier
+    versions call the name function with the tag's name and attributes instead.
+    """
+    def __init__(self, wanted):
+        super().__init__(wanted)
+        self.wanted = wanted
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.wanted(name, attrs or {})
+
+def book_page_strainer(skip_json_ld_fields):
+    """
+    SoupStrainer that keeps only the book page elements the scraper reads. When the JSON-LD
+    payload already supplies rating, ratings count, page count and cover, those are skipped too.
+    """
+    test_ids = BOOK_TEST_IDS - {'ratingsCount', 'pagesFormat'} if skip_json_ld_fields else BOOK_TEST_IDS
+    classes = BOOK_CLASSES - {'RatingStatistics__rating', 'ResponsiveImage'} if skip_json_ld_fields else BOOK_CLASSES
+
+    def wanted(name, attrs):
+        if attrs.get('data-testid') in test_ids:
+            return True
+        tag_class = tag_classes(attrs)
+        if tag_class & classes:
+            return True
+        return name == 'h3' and SERIES_CLASSES <= tag_class
+
+    return TargetedStrainer(wanted)
+
+def search_page_strainer():
+    def wanted(name, attrs):
+        return name == 'a' and 'bookTitle' in tag_classes(attrs)
+
+    return TargetedStrainer(wanted)
+
+def make_soup(html, backend, strainer):
+    features, targeted = BACKENDS[backend]
+    return BeautifulSoup(html, features, parse_only=strainer if targeted else None)
+
+def extract_json_ld(html):
+    """
+    Pull the fields scrape_book_info needs out of the page's embedded JSON-LD without building
+    a DOM. Returns None if the payload is missing or incomplete.
+    """
+    match = JSON_LD_PATTERN.search(html)
+    if match is None:
+        return None
+    try:
+        payload = json.loads(match.group(1))
+        return {
+            'rating': float(payload['aggregateRating']['ratingValue']),
+            'num ratings': int(payload['aggregateRating']['ratingCount']),
+            'pages': int(payload['numberOfPages']),
+            'cover': payload['image'],
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def parse_book_page(html, book_id, backend=None):
+    """
+    Build the BookMetadata for a Goodreads /book/show/ page. Targeted backends fall back
+    to the full html.parser tree if any element they expected is missing. A missing page
+    count or publication info becomes None; a missing title, author, rating or ratings
+    count raises ValueError naming the field.
+    """
+    with metrics.timer('parse'):
+        return parse_book_html(html, book_id, backend or PARSER_BACKEND)
+
+def parse_book_html(html, book_id, backend):
+    if BACKENDS[backend][1]:
+        try:
+            return parse_book_soup(html, book_id, backend, extract_json_ld(html))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return parse_book_soup(html, book_id, 'soup', None)
+
+def element_text(soup, name, attrs, field, book_id, required=False):
+    """
+    Stripped text of the first matching element. A missing element raises ValueError naming
+    the book and field if it is required, and gives None otherwise.
+    """
+    element = soup.find(name, attrs)
+    if element is None:
+        if required:
+            raise ValueError(f"Goodreads ID #{book_id}: missing {field}")
+        return None
+    return element.get_text(strip=True)
+
+def parse_book_soup(html, book_id, backend, json_ld):
+    soup = make_soup(html, backend, book_page_strainer(json_ld is not None))
+
+    # Extract title using the class and data-testid attribute
+    title = element_text(soup, 'h1', {'data-testid': 'bookTitle'}, 'title', book_id, required=True)
+    title = title.replace('\u200b', '')
+
+    # Extract author
+    author = element_text(soup, 'span', {'data-testid': 'name'}, 'author', book_id, required=True)
+    author = author.strip('\n')
+
+    # Extract publication date; some editions show none
+    pub_date = element_text(soup, 'p', {'data-testid': 'publicationInfo'}, 'publication info', book_id)
+
+    if json_ld is not None:
+        rating = json_ld['rating']
+        num_ratings = json_ld['num ratings']
+        pages = json_ld['pages']
+    else:
+        # Extract rating
+        rating = element_text(soup, 'div', {'class': 'RatingStatistics__rating'}, 'rating', book_id, required=True)
+
+        # Extract number of ratings
+        num_ratings = element_text(soup, 'span', {'data-testid': 'ratingsCount'}, 'ratings count', book_id,
+                                   required=True)
+
+        # Extract page count; missing for some audiobook and ebook editions
+        pages = element_text(soup, 'p', {'data-testid': 'pagesFormat'}, 'page count', book_id)
+
+    # Extract summary
+    summary = soup.find('div', class_='DetailsLayoutRightParagraph__widthConstrained').get_text(strip=False)
+    with metrics.timer('clean'):
+        summary = process_summary(summary)
+
+    # Extract genres
+    genres = soup.find('div', {'data-testid': 'genresList'}).find_all('span', class_='Button__labelItem')
+    genres = [genre.get_text(strip=True) for genre in genres[:-1]]
+
+    # Extract series info
+    series = soup.find('h3', class_='Text Text__title3 Text__italic Text__regular Text__subdued')
+    if series is not None:
+        series = series.get_text(strip=False).replace(' (Publication Order)', '')
+
+    # Get cover image
+    if json_ld is not None:
+        cover = json_ld['cover']
+    else:
+        cover = soup.find('img', {'class': 'ResponsiveImage'})['src']
+
+    # Format author name for sorting
+    sort_author = format_name(author)
+
+    return BookMetadata.from_scraped(book_id, title, author, sort_author, series, rating, num_ratings, pages,
+                                     pub_date, summary, genres, cover)
+
+def search_result_id(href):
+    # Extracting book ID from the link, /book/show/123.Title or /book/show/123-title
+    slug = href.split('/')[-1]
+    if slug.split('.')[0].isdigit():
+        return slug.split('.')[0]
+    return slug.split('-')[0]
+
+def parse_search_page(html, backend=None):
+    """
+    Return the Goodreads ID of the first result on a search page, or None if there are no results.
+    """
+    backend = backend or PARSER_BACKEND
+    with metrics.timer('parse search'):
+        soup = make_soup(html, backend, search_page_strainer())
+
+    # Assuming the first search result is the book we're looking for
+    book_link = soup.find('a', class_='bookTitle')
+
+    if book_link and 'href' in book_link.attrs:
+        return search_result_id(book_link['href'])
+    return None
+
+def is_search_result(name, attrs):
+    return name == 'tr' and 'schema.org/Book' in (attrs.get('itemtype') or '')
+
+def search_results_strainer():
+    return TargetedStrainer(is_search_result)
+
+def parse_search_results(html, limit=5, backend=None):
+    """
+    Return the first `limit` results on a search page as dictionaries with the Goodreads
+    'id', the 'title' as Goodreads shows it (series included) and the first 'author'.
+    """
+    backend = backend or PARSER_BACKEND
+    with metrics.timer('parse search'):
+        soup = make_soup(html, backend, search_results_strainer())
+
+    results = []
+    for row in soup.find_all(lambda tag: is_search_result(tag.name, tag.attrs), limit=limit):
+        book_link = row.find('a', class_='bookTitle')
+        if not book_link or 'href' not in book_link.attrs:
+            continue
+        author_link = row.find('a', class_='authorName')
+        results.append({
+            'id': search_result_id(book_link['href']),
+            'title': book_link.get_text(' ', strip=True),
+            'author': author_link.get_text(' ', strip=True) if author_link else '',
+        })
+    return results
@@ -0,0 +1,272 @@
+import csv
+import json
+import os
+from datetime import date
+from tqdm import tqdm
+from notion_api import build_update_payload, send_page_update, send_page_create
+from mirror import database_pages, rich_text_value
+from utilities import bounded_map
+
+# Rows per written chunk: one Parquet row group or Arrow record batch, and per read batch
+CHUNK_ROWS = 1000
+
+# One row per page, in file column order
+COLUMNS = ['page_id', 'title', 'goodreads_id', 'author', 'sort_author', 'series', 'rating', 'num_ratings',
+           'pages', 'publication_date', 'summary', 'genres', 'cover']
+
+# CSV has no list type; genres are joined with this separator
+GENRE_SEPARATOR = '; '
+
+def text_value(page, name, kind=None):
+    # Whole text of a title or rich_text property, joining every fragment
+    prop = page.get("properties", {}).get(name, {})
+    fragments = prop.get(kind or prop.get("type") or "rich_text") or []
+    return ''.join(fragment.get("plain_text") or fragment.get("text", {}).get("content", "") for fragment in fragments)
+
+def page_to_row(page):
+    """
+    Flatten a queried Notion page into a row of COLUMNS, with None for empty properties.
+    """
+    properties = page.get("properties", {})
+    published = (properties.get("Publication Date", {}).get("date") or {}).get("start")
+    cover = page.get("cover") or {}
+    return {
+        'page_id': page['id'],
+        'title': text_value(page, "Name", "title") or None,
+        'goodreads_id': rich_text_value(page, "ID", "rich_text") or None,
+        'author': text_value(page, "Author") or None,
+        'sort_author': text_value(page, "Sort Author") or None,
+        'series': text_value(page, "Series") or None,
+        'rating': properties.get("Goodreads Rating", {}).get("number"),
+        'num_ratings': properties.get("Number of Ratings", {}).get("number"),
+        'pages': properties.get("Page Count", {}).get("number"),
+        'publication_date': date.fromisoformat(published[:10]) if published else None,
+        'summary': text_value(page, "Summary") or None,
+        'genres': [option["name"] for option in properties.get("Genres", {}).get("multi_select") or []],
+        'cover': (cover.get("external") or {}).get("url"),
+    }
+
+def row_to_properties(row):
+    """
+    update_page keyword arguments for a row read back from any format; empty cells are left out.
+    """
+    def value(column, convert=None):
+        cell = row.get(column)
+        if cell is None or cell == '':
+            return None
+        return convert(cell) if convert is not None else cell
+
+    genres = row.get('genres')
+    if isinstance(genres, str):
+        genres = [genre.strip() for genre in genres.split(GENRE_SEPARATOR.strip()) if genre.strip()]
+    return {
+        'pid': value('goodreads_id', str),
+        'author': value('author'),
+        'sort_author': value('sort_author'),
+        'series': value('series'),
+        'rating': value('rating', float),
+        'num_ratings': value('num_ratings', lambda cell: int(float(cell))),
+        'page_cnt': value('pages', lambda cell: int(float(cell))),
+        'pub_date': value('publication_date', lambda cell: cell if isinstance(cell, date) else date.fromisoformat(cell)),
+        'summary': value('summary'),
+        'genres': list(genres) if genres else None,
+        'cover': value('cover'),
+    }
+
+def chunked(rows, size=CHUNK_ROWS):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_pyarrow():
+    # pyarrow is only needed for the columnar formats
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow files need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+def arrow_schema(pa):
+    return pa.schema([
+        ('page_id', pa.string()), ('title', pa.string()), ('goodreads_id', pa.string()), ('author', pa.string()),
+        ('sort_author', pa.string()), ('series', pa.string()), ('rating', pa.float64()),
+        ('num_ratings', pa.int64()), ('pages', pa.int64()), ('publication_date', pa.date32()),
+        ('summary', pa.string()), ('genres', pa.list_(pa.string())), ('cover', pa.string()),
+    ])
+
+"""
+Writers take the destination path and an iterator of row chunks, and return the number of
+rows written. Readers yield rows one at a time, reading the file a chunk at a time.
+"""
+def write_jsonl(path, chunks):
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            for row in chunk:
+                record = dict(row)
+                if record['publication_date'] is not None:
+                    record['publication_date'] = record['publication_date'].isoformat()
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += len(chunk)
+    return count
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def write_csv(path, chunks):
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for chunk in chunks:
+            writer.writerows(dict(row, genres=GENRE_SEPARATOR.join(row['genres'])) for row in chunk)
+            count += len(chunk)
+    return count
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+def write_parquet(path, chunks):
+    pa = import_pyarrow()
+    schema = arrow_schema(pa)
+    count = 0
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
+
+def read_parquet(path):
+    pa = import_pyarrow()
+    for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=CHUNK_ROWS):
+        yield from batch.to_pylist()
+
+def write_arrow(path, chunks):
+    pa = import_pyarrow()
+    schema = arrow_schema(pa)
+    count = 0
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
+
+def read_arrow(path):
+    pa = import_pyarrow()
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield from reader.get_batch(i).to_pylist()
+
+FORMATS = {
+    'jsonl': (write_jsonl, read_jsonl),
+    'csv': (write_csv, read_csv),
+    'parquet': (write_parquet, read_parquet),
+    'arrow': (write_arrow, read_arrow),
+}
+
+def file_format(path, format=None):
+    # The explicit format, or the one named by the file extension
+    format = format or os.path.splitext(path)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise ValueError(f"unknown file format {format!r}; use one of {', '.join(FORMATS)}")
+    return format
+
+def export_database(path, format=None):
+    """
+    Write every page of the database to `path` as JSONL, CSV, Parquet or Arrow (from the
+    extension unless `format` is given). Pages are streamed from the query in chunks of
+    CHUNK_ROWS, so memory stays flat however large the database is. The file is written
+    under a temporary name and renamed once complete.
+    """
+    try:
+        write = FORMATS[file_format(path, format)][0]
+        rows = (page_to_row(page) for page in tqdm(database_pages(), desc="Exporting", unit="page"))
+        partial = path + '.partial'
+        count = write(partial, chunked(rows))
+        os.replace(partial, path)
+        print(f"Exported {count} page(s) to {path}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def import_database(path, format=None, workers=1):
+    """
+    Write the rows of an exported file into the database. Rows whose Goodreads ID is already
+    in the database are skipped, so an interrupted import can simply be rerun. Other rows fill
+    in the page with the same title if there is one without an ID, and are created as new
+    pages otherwise. Rows are read a chunk at a time and written from `workers` threads, within
+    the Notion rate limit; a row that fails is reported at the end without stopping the import.
+    """
+    print('Importing ' + path + '...')
+    created = updated = skipped = 0
+    failures = []
+
+    def write_row(row, page_id):
+        payload = build_update_payload(create_genres=True, **row_to_properties(row))
+        if page_id is not None:
+            send_page_update(page_id, payload)
+            return 'updated'
+        send_page_create(row.get('title') or '', payload)
+        return 'created'
+
+    try:
+        read = FORMATS[file_format(path, format)][1]
+
+        # Index the database: the Goodreads IDs it holds, and its pages without one by title
+        known_ids = set()
+        untitled = {}
+        for page in database_pages():
+            goodreads_id = rich_text_value(page, "ID", "rich_text")
+            if goodreads_id:
+                known_ids.add(goodreads_id)
+            else:
+                untitled.setdefault(text_value(page, "Name", "title").casefold(), page['id'])
+
+        with tqdm(desc="Importing", unit="row") as pbar:
+            def pending():
+                nonlocal skipped
+                for row in read(path):
+                    goodreads_id = str(row.get('goodreads_id') or '')
+                    if goodreads_id and goodreads_id in known_ids:
+                        skipped += 1
+                        pbar.update(1)
+                        continue
+                    if goodreads_id:
+                        # A repeated ID later in the file is skipped too
+                        known_ids.add(goodreads_id)
+                    title = row.get('title') or ''
+                    yield row, untitled.pop(title.casefold(), None) if title else None
+
+            def finished(item, outcome):
+                nonlocal created, updated
+                if outcome == 'created':
+                    created += 1
+                else:
+                    updated += 1
+                pbar.update(1)
+
+            def failed(item, e):
+                failures.append((item[0], e))
+                pbar.update(1)
+
+            bounded_map(lambda item: write_row(*item), pending(), max(workers, 1), finished, failed)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    print(f"{created} page(s) created, {updated} updated, {skipped} skipped (ID already present)")
+    if failures:
+        print(f"{len(failures)} row(s) could not be imported:")
+        for row, e in failures:
+            print(f"      {row.get('title')} ({row.get('goodreads_id')}): {e}")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+import http_client
+import metrics
+from rate_limiter import limited
+
+COVER_DIR = os.path.join('.bookdb', 'covers')
+
+# Set by main.py from --cover_store
+COVER_STORE_ENABLED = False
+
+class CoverStore:
+    """
+    Content-addressed store of downloaded cover images. Each image is saved once under its
+    SHA-256, and the digest of every URL seen is indexed, so a cover whose URL changed but
+    whose image did not can be told apart from a genuinely new cover.
+    """
+    def __init__(self, directory=COVER_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def digest(self, url):
+        """
+        Return the SHA-256 of the image at a URL, downloading and storing it the first time.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT sha256 FROM images WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            return row[0]
+
+        with limited(url) as outcome:
+            with metrics.timer('cover'):
+                response = http_client.get(url)
+            outcome.report(response.status_code, response.headers, throttled=http_client.was_throttled(response))
+        if response.status_code != 200:
+            raise ValueError(f"could not download cover {url}: HTTP {response.status_code}")
+        data = response.content
+        metrics.count('cover bytes', len(data))
+        digest = hashlib.sha256(data).hexdigest()
+
+        extension = os.path.splitext(urlparse(url).path)[1] or '.img'
+        path = os.path.join(self.directory, digest + extension)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?)", (url, digest, time.time()))
+            self.conn.commit()
+        return digest
+
+    def same_image(self, url, other_url):
+        return self.digest(url) == self.digest(other_url)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Return the shared store, or None unless COVER_STORE_ENABLED is set.
+    """
+    global _store
+    with _store_lock:
+        if _store is None and COVER_STORE_ENABLED:
+            _store = CoverStore()
+        return _store
+
+def page_cover_url(page):
+    # URL of a page's external cover, or None if it has no cover or an uploaded one
+    cover = page.get("cover") or {}
+    return (cover.get("external") or {}).get("url")
+
+def cover_changed(page, url):
+    """
+    Whether `url` should be written as the page's cover: it differs from the current cover
+    URL and, when the cover store is enabled, the images behind the two URLs differ too.
+    """
+    current = page_cover_url(page)
+    if url == current:
+        return False
+    store = get_store()
+    if store is None or current is None:
+        return True
+    return not store.same_image(current, url)
@@ -1,39 +1,29 @@
-import requests
-from bs4 import BeautifulSoup
-from utilities import process_summary, format_name, truncate_string, add_newline_after_closing_quote, remove_asin_isbn_sentences, adjust_spaces_around_quotes
-from notion_api import update_with_packet, refresh_with_packet, update_page, find_page_by_title
-from IPython.display import display, Image
+from utilities import bounded_map
+from book_parser import parse_search_page
+from parse_pool import parse_book_response
+from notion_api import update_with_packet, refresh_with_packet, update_page
+from notion_api import ID_IS_EMPTY, ID_IS_NOT_EMPTY, refresh_changes, WriteQueue
 from config import NOTION_TOKEN, DATABASE_ID
-from notion_api import notion_client
 from tqdm import tqdm
+from http_cache import cached_get
+from mirror import find_page_by_title, database_pages, suggest_titles, rich_text_value
+from journal import RunJournal
+from refresh_state import RefreshState, RefreshBudget
+from cover_store import cover_changed
+import resolver
 
 """
 Function that takes the title of a book as input and return a dictionary that holds
 the metadata for the best match for the title.
 """
 def get_goodreads_id(title):
-    search_url = f"https://www.goodreads.com/search?q=\"{title}\""
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0'
-    }
-
     # Fetch the search page
-    response = requests.get(search_url, headers=headers)
+    response = cached_get(resolver.search_url(title), 'search')
 
     if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Assuming the first search result is the book we're looking for
-        # This is where you'll need to adjust based on the actual HTML structure of Goodreads search results
-        book_link = soup.find('a', class_='bookTitle')  # Hypothetical selector; adjust based on actual structure
-
-        if book_link and 'href' in book_link.attrs:
-            if book_link['href'].split('/')[-1].split('.')[0].isdigit():
-                book_id = book_link['href'].split('/')[-1].split('.')[0]  # Extracting book ID from the link
-            else:
-                book_id = book_link['href'].split('/')[-1].split('-')[0]
+        book_id = parse_search_page(response.text)
 
+        if book_id is not None:
             return book_id
 
         else:
@@ -45,163 +35,325 @@ def get_goodreads_id(title):
 
 def scrape_book_info(book_id):
     book_url = 'https://www.goodreads.com/book/show/' + book_id
-    # Headers to simulate a browser visit
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
 
     # Fetch the page
-    response = requests.get(book_url, headers=headers)
-
-    metadata = {}
+    response = cached_get(book_url, 'book')
 
     if response.status_code == 200:
-        # Parse the page using BeautifulSoup
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extract title using the class and data-testid attribute
-        title = soup.find('h1', {'data-testid': 'bookTitle'}).get_text(strip=True)
-        metadata['title'] = title.replace('\u200b', '')
-
-        # Extract author
-        author = soup.find('span', {'data-testid': 'name'}).get_text(strip=True)
-        metadata['author'] = author.strip('\n')
-
-        # Extract publication date
-        pub_date = soup.find('p', {'data-testid': 'publicationInfo'}).get_text(strip=True)
-        metadata['publication date'] = pub_date.replace("First published ", '')
-
-        # Extract rating
-        rating = soup.find('div', {'class': 'RatingStatistics__rating'}).get_text(strip=True)
-        metadata['rating'] = rating
-
-        # Extract number of ratings
-        num_ratings = soup.find('span', {'data-testid': 'ratingsCount'}).get_text(strip=True)
-        metadata['num ratings'] = num_ratings.strip('ratings')
-
-        # Extract page count
-        pages = soup.find('p', {'data-testid': 'pagesFormat'}).get_text(strip=True)
-        metadata['pages'] = pages.split(' ')[0]
-
-        # Extract summary
-        summary = soup.find('div', class_='DetailsLayoutRightParagraph__widthConstrained').get_text(strip=False)
-        summary = process_summary(summary)
-        metadata['summary'] = summary
-
-        # Extract genres
-        genres = soup.find('div', {'data-testid': 'genresList'}).find_all('span', class_='Button__labelItem')
-        for i in range(len(genres)):
-            genres[i] = genres[i].get_text(strip=True)
-        metadata['genres'] = genres[:-1]
-
-        # Extract series info
-        series = soup.find('h3', class_='Text Text__title3 Text__italic Text__regular Text__subdued')
-        if series is not None:
-            metadata['series'] = series.get_text(strip=False).replace(' (Publication Order)', '')
-
-        metadata['pid'] = book_id
-
-        # Get cover image
-        image_tag = soup.find('img', {'class': 'ResponsiveImage'})['src']
-        metadata['cover'] = image_tag
-
-        # Format author name for sorting
-        sort_author = format_name(author.strip('\n'))
-        metadata['sort author'] = sort_author
+        # Parse the page with the configured backend (see book_parser.py), in the parse pool if there is one
+        metadata = parse_book_response(response, book_id)
     else:
         print("Failed to retrieve the page")
         metadata = None
 
     return metadata
 
+# Passed as the resolution when the title has not been looked up yet
+UNRESOLVED = object()
+
+def fetch_new_entry(page, resolution=UNRESOLVED, packets=None):
+    """
+    Find the Goodreads match for the title of an entry whose ID is empty, then scrape it and
+    write its metadata to the page. Matches below resolver.MIN_CONFIDENCE are queued for review
+    instead. Returns the outcome to record in the run journal.
+    """
+    # Extract the Name (title) of the entry
+    name = rich_text_value(page, "Name", "title")
+    if not name:
+        return None
+
+    # Extract the ID property to check if it's empty
+    id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
+    if id_property != []:
+        return None
+
+    # ID field is empty
+    author = rich_text_value(page, "Author", "rich_text")
+    if resolution is UNRESOLVED:
+        resolution = resolver.resolve_title(name, author)
+    if isinstance(resolution, Exception):
+        raise resolution
+    print('\n ----- ' + name + ' -----')
+    if resolution is None:
+        print("Book not found")
+        return 'no match'
+    goodreads_id = resolution['id']
+    if resolution['confidence'] < resolver.MIN_CONFIDENCE:
+        resolver.get_memo().queue_review(page['id'], name, author, resolution)
+        print(f"      Best match #{goodreads_id} ({resolution['title']}) scored {resolution['confidence']:.2f}; queued for review")
+        return 'review'
+    print(f"      Found ID #{goodreads_id} (confidence {resolution['confidence']:.2f})")
+
+    # The same book may be queued more than once; scrape it only once per run
+    metadata = packets.get(goodreads_id) if packets is not None else None
+    if metadata is None:
+        metadata = scrape_book_info(goodreads_id)
+        if metadata is None:
+            raise ValueError(f"could not scrape Goodreads ID #{goodreads_id}")
+        if packets is not None:
+            packets[goodreads_id] = metadata
+    if not update_with_packet(page['id'], metadata):
+        raise RuntimeError("the Notion update failed")
+    print(describe_new_entry(metadata))
+    return 'updated'
+
+def describe_new_entry(metadata):
+    return ('      ' + metadata.title + ' --- ' + metadata.author + ((' --- ' + metadata.series) if metadata.series is not None else '') +
+            f"\n      {metadata.publication_date} --- {metadata.rating:.2f} with {metadata.num_ratings:,} ratings")
+
 """
   Iterates through all entries in a Notion database, checks if the "ID" field is empty,
-  and if so, updates it with get_goodreads_id(title).
+  and if so, updates it with the best scoring Goodreads match for its title and author.
+  Titles are collected first and each distinct one is searched once (or not at all when
+  an earlier run already resolved it); low-confidence matches are queued for --review.
   Displays the title, author, and publication date corresponding to the retrieved ID.
-  Titles are all updates, using either a new ID or the one stored in the database
+  Each outcome is journaled, so with resume=True pages finished by an earlier run are skipped.
 """
-def check_and_fetch_ids():
+def check_and_fetch_ids(resume=False, workers=1):
     print('The following pages were updated with new IDs:')
-    old_updates = 0
-    new_updates = 0
-    try:
-        # Query the database to get all entries
-        query_results = notion_client.databases.query(database_id=DATABASE_ID)
-
-        for page in query_results.get("results", []):
-            # Extract the Name (title) of the entry
-            name_property = page["properties"].get("Name", {}).get("title", [{}])
-
-            if name_property:
-                name = name_property[0].get("text", {}).get("content", "")
-
-                # Extract the ID property to check if it's empty
-                id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
-                if id_property == []:
-                    # ID field is empty
-                    goodreads_id = get_goodreads_id(name)
-                    print('\n ----- ' + name + ' -----')
-                    print(f"      Found ID #{goodreads_id}")
-                    metadata = scrape_book_info(goodreads_id)
-                    update_with_packet(page['id'], metadata)
-                    print('      ' + metadata['title'] + ' --- ' + metadata['author'] + ((' --- ' + metadata.get('series')) if metadata.get('series') is not None else ''))
-                    print('      ' + metadata['publication date'] + ' --- ' + metadata['rating'] + ' with ' + metadata['num ratings'] + ' ratings')
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    failures = []
+    reviews = 0
+    with RunJournal('get_new', resume) as journal:
+        try:
+            # Collect the entries whose ID is still empty, then resolve their titles as a batch
+            pages = [page for page in database_pages(filter=ID_IS_EMPTY)
+                     if not journal.done(page['id']) and rich_text_value(page, "Name", "title")]
+            entries = [(rich_text_value(page, "Name", "title"), rich_text_value(page, "Author", "rich_text")) for page in pages]
+            resolutions = resolver.resolve_titles(entries, workers)
+            packets = {}
+            for page, entry in zip(pages, entries):
+                # A malformed page or failed request only affects its own entry
+                try:
+                    outcome = fetch_new_entry(page, resolutions.get(resolver.match_key(*entry)), packets)
+                    if outcome is not None:
+                        journal.record(page['id'], outcome)
+                    if outcome == 'review':
+                        reviews += 1
+                except Exception as e:
+                    journal.record(page['id'], 'failed', str(e))
+                    failures.append((page, e))
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    if reviews:
+        print(f"{reviews} low-confidence match(es) queued; run with --review to confirm them.")
+    report_failures(failures)
+
+def page_title(page):
+    # Extract the Name (title) of the entry
+    name_property = page["properties"].get("Name", {}).get("title", [{}])
+    return name_property[0].get('text', {}).get('content', 'Unknown Title') if name_property else 'Unknown Title'
+
+def report_failures(failures, queued_failures=()):
+    if failures or queued_failures:
+        print(f"{len(failures) + len(queued_failures)} page(s) could not be updated:")
+        for page, e in failures:
+            print(f"      {page_title(page)} ({page['id']}): {e}")
+        for page_id, e in queued_failures:
+            print(f"      {page_id}: {e}")
+
+def preview_cover(packet):
+    # Show a cover that is about to be written; IPython is only needed when previewing
+    from IPython.display import display, Image
+    display(Image(url=packet.cover))
+    print('--- ' + packet.title + ' ---')
+
+def refresh_entry(page, all_props=False, queue=None, journal=None, state=None, preview=False):
+    """
+    Scrape fresh Goodreads data for a single database page and write it back to Notion.
+    With a WriteQueue, only properties that differ from the page are queued for writing
+    and the queue journals the outcome; otherwise it is journaled here once written.
+    The scraped ratings count is noted in the RefreshState, if one is given.
+    With all_props, only the cover is synced, and only when cover_changed() says it
+    differs from the page's current one; preview displays each cover being written.
+    Returns the page title, or None if the page has no Goodreads ID to refresh.
+    """
+    title = page_title(page)
+
+    # Extract the ID property to check if it's filled
+    id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
+    if not id_property:
+        return None
+
+    # Extract ID
+    id = id_property[0]['text']['content']
+    packet = scrape_book_info(id)
+    if packet is None:
+        raise ValueError(f"could not scrape Goodreads ID #{id}")
+    if state is not None:
+        state.observe(page['id'], id, packet.num_ratings)
+
+    if all_props:
+        # Cover sync: only write a cover that differs from the one already on the page
+        if packet.cover is None or not cover_changed(page, packet.cover):
+            if queue is not None:
+                queue.skip(page['id'])
+            elif journal is not None:
+                journal.record(page['id'], 'unchanged')
+            return title
+        if preview:
+            preview_cover(packet)
+        if queue is not None:
+            queue.enqueue(page['id'], cover=packet.cover)
+            return title
+        written = update_page(page['id'], cover=packet.cover)
+    elif queue is not None:
+        # Queue only the minimal properties that actually changed
+        changes = refresh_changes(page, packet)
+        if changes:
+            queue.enqueue(page['id'], **changes)
+        else:
+            queue.skip(page['id'])
+        return title
+    else:
+        # Refresh book information with minimal properties
+        written = refresh_with_packet(page['id'], packet)
+    if not written:
+        raise RuntimeError("the Notion update failed")
+    if journal is not None:
+        journal.record(page['id'], 'updated')
+    return title
+
+def update_all_ids(all_props=False, workers=1, resume=False, stale_after=None, max_pages=None, max_minutes=None,
+                   preview=False):
+    """
+    Refresh every page that has a Goodreads ID. With workers > 1, pages are scraped and written
+    from a thread pool so network waits overlap; requests stay within the per-host rate limits.
+    A page that fails is recorded and reported once the run is over instead of aborting it.
+    Each outcome is journaled, so with resume=True pages finished by an earlier run are skipped.
+    With stale_after (in days), only pages not refreshed for that long are visited, those with
+    the oldest and fastest-moving ratings first; max_pages and max_minutes end the run early.
+    With all_props, covers are synced instead (see refresh_entry).
+    """
+    print('Syncing covers for all known IDs...' if all_props else 'Updating data for all known IDs...')
+    failures = []
+    journal = RunJournal('update_covers' if all_props else 'update', resume)
+    queue = WriteQueue(journal=journal)
+    # Remember when each page's ratings were refreshed, for later --stale_after runs
+    state = None if all_props else RefreshState()
+    if state is not None:
+        journal.listeners.append(state.record)
+    budget = RefreshBudget(max_pages, max_minutes * 60 if max_minutes is not None else None)
+
+    def record_failure(page, e):
+        journal.record(page['id'], 'failed', str(e))
+        failures.append((page, e))
 
-def update_all_ids(all_props=False):
-    print('Updating data for all known IDs...')
     try:
-        # Query the database to get all entries
-        query_results = notion_client.databases.query(database_id=DATABASE_ID)
-        results = query_results.get("results", [])
-
-        # Initialize progress bar with dynamic total based on the number of results
-        with tqdm(total=len(results), desc="Updating IDs", unit="entry") as pbar:
-            for page in results:
-                # Extract the Name (title) of the entry
-                name_property = page["properties"].get("Name", {}).get("title", [{}])
-                title = name_property[0].get('text', {}).get('content', 'Unknown Title') if name_property else 'Unknown Title'
-
-                # Extract the ID property to check if it's filled
-                id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
-                if id_property:
-                    # Extract ID
-                    id = id_property[0]['text']['content']
-                    # Update progress bar description with the current title being processed
-                    pbar.set_description(f"Updating: {title}")
-
-                    if not all_props:
-                        # Refresh book information with minimal properties
-                        refresh_with_packet(page['id'], scrape_book_info(id))
-                    else:
-                        # Update with complete information
-                        p = scrape_book_info(id)
-                        update_page(page['id'], cover=p['cover'])
-                        display(Image(url=p['cover']))
-                        print('--- ' + p['title'] + ' ---')
-
-                # Update progress bar after processing each entry
-                pbar.update(1)
+        # Stream the entries that have an ID; the total is unknown until the last batch arrives
+        pages = database_pages(filter=ID_IS_NOT_EMPTY)
+        total = None
+        if stale_after is not None and state is not None:
+            pages = state.stale_pages(pages, stale_after)
+            total = len(pages)
+            print(f"{total} page(s) not refreshed in the last {stale_after:g} day(s)")
+        pages = budget.pages(pages, journal.done)
+
+        with tqdm(desc="Updating IDs", unit="entry", total=total) as pbar:
+            if workers <= 1:
+                for page in pages:
+                    if journal.done(page['id']):
+                        pbar.update(1)
+                        continue
+                    try:
+                        title = refresh_entry(page, all_props, queue, journal, state, preview)
+                        if title is not None:
+                            # Update progress bar description with the current title being processed
+                            pbar.set_description(f"Updating: {title}")
+                    except Exception as e:
+                        record_failure(page, e)
+
+                    # Update progress bar after processing each entry
+                    pbar.update(1)
+            else:
+                def pending():
+                    for page in pages:
+                        if journal.done(page['id']):
+                            pbar.update(1)
+                            continue
+                        yield page
+
+                # The bar is only touched from this thread, as each entry finishes
+                def finished(page, title):
+                    if title is not None:
+                        pbar.set_description(f"Updated: {title}")
+                    pbar.update(1)
+
+                def failed(page, e):
+                    record_failure(page, e)
+                    pbar.update(1)
+
+                bounded_map(lambda page: refresh_entry(page, all_props, queue, journal, state, preview),
+                            pending(), workers, finished, failed)
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
+    # Write whatever is still queued, then report
+    queue.flush()
+    journal.close()
+    if state is not None:
+        state.close()
+    if budget.stopped is not None:
+        print(f"Stopped after {budget.handed_out} page(s): {budget.stopped} budget reached")
+    print(queue.summary())
+    report_failures(failures, queue.failed)
+
 def fix_match():
     response = input("Enter title to fix or Q to quit:  ")
     while response != "Q" and response != "q":
         page = find_page_by_title(response)
         if page == []:
             print("No page for title " + response + " found in database")
+            suggestions = suggest_titles(response)
+            if suggestions:
+                print("Did you mean: " + ", ".join(suggestions))
         else:
             page = page[0]
             new_id = input("Enter new Goodreads ID: ")
             print('Scraping book info...')
             packet = scrape_book_info(new_id)
-            print(packet['title'] + ' by ' + packet['author'] + ' --- ' + packet['publication date'])
+            print(f"{packet.title} by {packet.author} --- {packet.publication_date}")
             conf = input('Set new ID (' + new_id +') for ' + response + '? (Y/N) ')
             if conf == 'Y' or conf == 'y':
                 update_with_packet(page['id'], packet)
+                # Replace the wrong match remembered for the title, so the same entry resolves to
+                # this book if it is added again
+                resolver.correct_choice(rich_text_value(page, "Name", "title"), new_id, packet)
                 print('ID #' + new_id + ' set for ' + response + '\n')
             elif conf == 'N' or conf == 'n':
                 print('Operation cancelled\n')
-        response = input("Enter title to fix or Q to quit:  ")
\ No newline at end of file
+        response = input("Enter title to fix or Q to quit:  ")
+
+def review_matches():
+    """
+    Walk through the low-confidence matches queued by --get_new. For each, pick one of the
+    scored search results or enter a Goodreads ID; the choice is scraped, written to the page
+    and remembered for the title.
+    """
+    pending = resolver.get_memo().pending_reviews()
+    if not pending:
+        print("No matches are waiting for review")
+        return
+    for item in pending:
+        print('\n ----- ' + item['name'] + ((' by ' + item['author']) if item['author'] else '') + ' -----')
+        for number, candidate in enumerate(item['candidates'], 1):
+            print(f"      {number}. #{candidate['id']} {candidate['title']} by {candidate['author']} (score {candidate['score']:.2f})")
+        choice = input("Pick a result number, enter a Goodreads ID, S to skip or Q to quit:  ").strip()
+        if choice in ('Q', 'q'):
+            break
+        if choice in ('S', 's', ''):
+            continue
+        if choice.isdigit() and 1 <= int(choice) <= len(item['candidates']):
+            new_id = item['candidates'][int(choice) - 1]['id']
+        else:
+            new_id = choice
+        print('Scraping book info...')
+        packet = scrape_book_info(new_id)
+        if packet is None:
+            print('Could not scrape Goodreads ID #' + new_id + '\n')
+            continue
+        if update_with_packet(item['page_id'], packet):
+            resolver.remember_choice(item['name'], item['author'], new_id, packet)
+            resolver.get_memo().resolve_review(item['page_id'])
+            print('ID #' + new_id + ' set for ' + item['name'] + ' (' + packet.title + ' by ' + packet.author + ')\n')
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import http_client
+import metrics
+from rate_limiter import limited
+
+CACHE_PATH = os.path.join('.bookdb', 'http_cache.sqlite')
+
+# Seconds a stored page is served without asking the server again, for each kind of page
+TTLS = {
+    'search': 7 * 24 * 3600,
+    'book': 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+# Compressed bytes kept on disk before the least recently used pages are evicted
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Share of MAX_CACHE_BYTES an eviction frees the cache down to, so a full cache evicts
+# once per few thousand stores rather than on every one
+EVICT_TARGET = 0.9
+# Least recently used entries read per eviction query
+EVICT_BATCH = 256
+
+# Set to False (e.g. with --no_cache) to always go to the network
+CACHE_ENABLED = True
+
+class CachedResponse:
+    """
+    Minimal stand-in for requests.Response carrying the fields the scrapers read.
+    """
+    def __init__(self, status_code, text, from_cache=False):
+        self.status_code = status_code
+        self.text = text
+        self.from_cache = from_cache
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    @property
+    def encoding(self):
+        return 'utf-8'
+
+class HttpCache:
+    """
+    SQLite-backed cache of successful GET responses keyed by URL. Bodies are stored
+    zlib-compressed alongside their ETag/Last-Modified validators, and the total size
+    is bounded by evicting the least recently accessed entries. The total is kept as a
+    running count, so a store never has to scan the table.
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, etag, last_modified, fetched_at = row
+        return {
+            'text': zlib.decompress(body).decode('utf-8'),
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': fetched_at,
+        }
+
+    def touch(self, url, revalidated=False):
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.conn.execute("UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            else:
+                self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+            self.conn.commit()
+
+    def store(self, url, text, etag=None, last_modified=None):
+        body = zlib.compress(text.encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, len(body), etag, last_modified, now, now)
+            )
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Once over max_bytes, drop the least recently used entries, a batch at a time from the
+        # accessed_at index, until the cache is down to EVICT_TARGET of it
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TARGET
+        while self.total_bytes > target:
+            rows = self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at LIMIT ?",
+                                     (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for url, size in rows:
+                evicted.append((url,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.conn.executemany("DELETE FROM responses WHERE url = ?", evicted)
+            metrics.count('cache evictions', len(evicted))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+            self.total_bytes = 0
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+        return _cache
+
+def fetch(url, headers=None):
+    """
+    Wait for the host's rate limit, then GET the URL, counting the request and its size.
+    The response is reported to the rate limiter so the limits on the host adapt.
+    """
+    with limited(url) as outcome:
+        with metrics.timer('fetch'):
+            response = http_client.get(url, headers=headers)
+        outcome.report(response.status_code, response.headers, throttled=http_client.was_throttled(response))
+    metrics.count('requests')
+    metrics.count('bytes downloaded', len(response.content))
+    return response
+
+def cached_get(url, kind, headers=None):
+    """
+    GET a URL through the on-disk cache. Fresh entries (younger than the TTL for `kind`)
+    are returned without any network traffic; stale ones are revalidated with
+    If-None-Match/If-Modified-Since where the server supplied validators.
+    """
+    if not CACHE_ENABLED:
+        return fetch(url, headers)
+
+    cache = get_cache()
+    entry = cache.lookup(url)
+    if is_fresh(entry, kind):
+        cache.touch(url)
+        metrics.count('cache hits')
+        return CachedResponse(200, entry['text'], from_cache=True)
+
+    response = fetch(url, revalidation_headers(entry, headers))
+    return settle(cache, url, entry, response)
+
+def is_fresh(entry, kind):
+    return entry is not None and time.time() - entry['fetched_at'] < TTLS.get(kind, DEFAULT_TTL)
+
+def revalidation_headers(entry, headers=None):
+    # Ask the server to answer 304 if the stored copy is still current
+    request_headers = dict(headers or {})
+    if entry is not None:
+        if entry['etag']:
+            request_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request_headers['If-Modified-Since'] = entry['last_modified']
+    return request_headers
+
+def settle(cache, url, entry, response):
+    """
+    Serve the stored copy for a 304, store a fresh 200, and return the response to use.
+    """
+    if response.status_code == 304 and entry is not None:
+        # Unchanged on the server; restart the TTL and serve the stored copy
+        cache.touch(url, revalidated=True)
+        metrics.count('cache revalidations')
+        return CachedResponse(200, entry['text'], from_cache=True)
+
+    metrics.count('cache misses')
+    if response.status_code == 200:
+        cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response
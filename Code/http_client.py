@@ -0,0 +1,100 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+# Headers to simulate a browser visit, shared by every Goodreads request
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+
+# Connections kept open per host; main.py raises this to at least --workers
+POOL_SIZE = 10
+# Seconds to wait for a connection, and then for each read from the socket
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Retries for connection errors and 429/5xx responses, with jittered exponential backoff
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.5
+BACKOFF_JITTER = 1.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+_session = None
+_session_lock = threading.Lock()
+
+def make_retry():
+    options = dict(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=BACKOFF_JITTER, **options)
+    except TypeError:
+        # urllib3 1.x has no jitter option
+        return Retry(**options)
+
+def build_session():
+    """
+    Create a requests.Session with a sized keep-alive connection pool, compressed transfers,
+    browser-like default headers and automatic retries.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=make_retry())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'Connection': 'keep-alive',
+    })
+    return session
+
+def get_session():
+    """
+    Return the shared session, building it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+def reset_session():
+    """
+    Close the shared session so the next request builds one from the current settings.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def get(url, headers=None):
+    """
+    GET a URL on the shared session with the configured timeouts.
+    """
+    response = get_session().get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    # urllib3 records each retry it made on the way to this response
+    retries = getattr(response.raw, 'retries', None)
+    if retries is not None and retries.history:
+        metrics.count('http retries', len(retries.history))
+    return response
+
+def was_throttled(response):
+    """
+    Whether urllib3 retried the request on the way to this response because the server
+    answered 429 or 5xx.
+    """
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    if retries is None:
+        return False
+    return any(attempt.status in RETRY_STATUSES for attempt in retries.history)
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import time
+
+JOURNAL_DIR = os.path.join('.bookdb', 'journals')
+
+# Outcomes that mean a page needs no more work when a run is resumed; failures and
+# searches that found no match are tried again
+FINISHED_OUTCOMES = {'updated', 'unchanged'}
+
+class RunJournal:
+    """
+    Append-only JSONL record of the outcome of every page a command has processed. Each line
+    is flushed as soon as it is written, so the journal survives a crash; a resumed run
+    reads it back and skips the pages that already finished.
+    """
+    def __init__(self, command, resume=False, directory=JOURNAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{command}.jsonl')
+        self.lock = threading.Lock()
+        self.finished = set()
+        # Callables given (page_id, outcome, detail) for every outcome recorded
+        self.listeners = []
+
+        if resume and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by the crash
+                    if entry.get('outcome') in FINISHED_OUTCOMES:
+                        self.finished.add(entry['page_id'])
+                    else:
+                        self.finished.discard(entry['page_id'])
+            self.file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self.file = open(self.path, 'w', encoding='utf-8')
+
+    def done(self, page_id):
+        return page_id in self.finished
+
+    def record(self, page_id, outcome, detail=None):
+        entry = {'page_id': page_id, 'outcome': outcome, 'time': time.time()}
+        if detail is not None:
+            entry['detail'] = detail
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            if outcome in FINISHED_OUTCOMES:
+                self.finished.add(page_id)
+        for listener in self.listeners:
+            listener(page_id, outcome, detail)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
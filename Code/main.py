@@ -1,21 +1,188 @@
 import argparse
-from goodreads import fix_match, check_and_fetch_ids, update_all_ids
+import sys
 
-def main():
+# Each command imports what it uses when it runs, so --help and the lighter commands start
+# without loading bs4, requests, notion_client or the async stack.
+
+def size_http_pool(workers):
+    # Keep a pooled Goodreads connection for every worker thread
+    import http_client
+    http_client.POOL_SIZE = max(http_client.POOL_SIZE, workers)
+
+def run_fix_match(args):
+    from goodreads import fix_match
+    fix_match()
+
+def run_get_new(args):
+    if args.engine == 'async':
+        import async_engine
+        async_engine.run('check_and_fetch_ids', args.concurrency, resume=args.resume)
+    else:
+        size_http_pool(args.workers)
+        from goodreads import check_and_fetch_ids
+        check_and_fetch_ids(resume=args.resume, workers=args.workers)
+
+def run_review(args):
+    from goodreads import review_matches
+    review_matches()
+
+def run_covers(args):
+    size_http_pool(args.workers)
+    from goodreads import update_all_ids
+    update_all_ids(all_props=True, workers=args.workers, resume=args.resume, max_pages=args.max_pages,
+                   max_minutes=args.max_minutes, preview=args.preview)
+
+def run_update(args):
+    if args.engine == 'async':
+        import async_engine
+        async_engine.run('update_all_ids', args.concurrency, resume=args.resume, stale_after=args.stale_after,
+                         max_pages=args.max_pages, max_minutes=args.max_minutes)
+    else:
+        size_http_pool(args.workers)
+        from goodreads import update_all_ids
+        update_all_ids(workers=args.workers, resume=args.resume, stale_after=args.stale_after,
+                       max_pages=args.max_pages, max_minutes=args.max_minutes)
+
+def run_export(args):
+    from bulk_io import export_database
+    export_database(args.export, args.format)
+
+def run_import(args):
+    from bulk_io import import_database
+    import_database(args.import_path, args.format, workers=args.workers)
+
+def run_query(args):
+    from book_index import query_books
+    query_books(args.query, rebuild=args.index)
+
+# Command flags in the order they take precedence when several are given
+COMMANDS = [
+    ('fix_match', run_fix_match),
+    ('get_new', run_get_new),
+    ('review', run_review),
+    ('covers', run_covers),
+    ('update', run_update),
+    ('export', run_export),
+    ('import_path', run_import),
+    ('query', run_query),
+    ('index', run_query),
+]
+
+# Same names as book_parser.BACKENDS, listed here so that parsing arguments does not import bs4
+PARSER_BACKENDS = ['lxml', 'soup', 'strained']
+
+def build_parser():
     parser = argparse.ArgumentParser(description='Command line tool for Goodreads and Notion integration.')
     parser.add_argument('--fix_match', action='store_true', help='Run the fix_match function')
     parser.add_argument('--get_new', action='store_true', help='Run the check_and_fetch_ids function')
     parser.add_argument('--update', action='store_true', help='Run the update_all_ids function')
-    args = parser.parse_args()
-    
-    if args.fix_match:
-        fix_match()
-    elif args.get_new:
-        check_and_fetch_ids()
-    elif args.update:
-        update_all_ids()
-    else:
+    parser.add_argument('--covers', action='store_true',
+                        help='Sync page covers with Goodreads, writing only covers that changed')
+    parser.add_argument('--export', metavar='PATH', help='Write every page of the database to PATH (.jsonl, .csv, .parquet or .arrow)')
+    parser.add_argument('--import', dest='import_path', metavar='PATH',
+                        help='Create or fill pages from an exported file, skipping Goodreads IDs already in the database')
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'parquet', 'arrow'],
+                        help='File format for --export and --import, if not given by the file extension')
+    parser.add_argument('--query', metavar='CONDITIONS',
+                        help='List books from the local index, e.g. "genre=fantasy pages<400 rating>=4" or "series=The Expanse"')
+    parser.add_argument('--index', action='store_true', help='Rebuild the local index used by --query from the database')
+    parser.add_argument('--review', action='store_true', help='Confirm the low-confidence matches queued by --get_new')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of titles to search (--get_new), pages to scrape and write (--update) or rows to import (--import) concurrently')
+    parser.add_argument('--min_confidence', type=float,
+                        help='Match score (0-1) below which --get_new queues a title for --review instead of writing it '
+                             '(default: resolver.MIN_CONFIDENCE)')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync',
+                        help='Run --get_new and --update on threads (sync) or on the asyncio engine (async)')
+    parser.add_argument('--concurrency', type=int,
+                        help='Goodreads requests in flight at once with --engine async '
+                             '(default: async_engine.GOODREADS_CONCURRENCY)')
+    parser.add_argument('--parse_workers', type=int, default=0,
+                        help='Processes parsing Goodreads pages (e.g. the number of cores); 0 parses in the fetching threads')
+    parser.add_argument('--cover_store', action='store_true',
+                        help='With --covers, download and hash covers in .bookdb/covers so a new URL for the same image is not written')
+    parser.add_argument('--preview', action='store_true', help='With --covers, display each cover written (needs IPython)')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the on-disk cache of Goodreads pages')
+    parser.add_argument('--parser', choices=PARSER_BACKENDS,
+                        help='HTML parser backend used to read Goodreads pages (default: lxml when it is installed)')
+    parser.add_argument('--mirror', action='store_true', help='Serve lookups and scans from the local mirror of the database')
+    parser.add_argument('--fixed_rates', action='store_true',
+                        help='Keep Goodreads and Notion at their default request rates instead of adapting to how they respond')
+    parser.add_argument('--timeout', type=float,
+                        help='Seconds to wait on a Goodreads response before retrying (default: http_client.READ_TIMEOUT)')
+    parser.add_argument('--stale_after', type=float, metavar='DAYS',
+                        help='With --update, refresh only pages not refreshed in DAYS days, most valuable first')
+    parser.add_argument('--max_pages', type=int, help='With --update, stop after refreshing this many pages')
+    parser.add_argument('--max_minutes', type=float, help='With --update, stop starting new pages after this many minutes')
+    parser.add_argument('--resume', action='store_true', help='Skip pages finished by the previous --get_new or --update run')
+    parser.add_argument('--profile', action='store_true', help='Print per-stage timings and request counters when the command finishes')
+    parser.add_argument('--metrics_json', metavar='PATH', help='Write the per-stage timings and counters to PATH as JSON')
+    return parser
+
+def configure(args):
+    """
+    Apply the options that were given to the module-level settings they control. Only runs
+    once a command has been chosen, and only imports the modules of options actually set, so
+    a command such as --query or --export loads nothing it does not use; options left unset
+    keep the defaults defined in each module.
+    """
+    if args.timeout is not None:
+        import http_client
+        http_client.READ_TIMEOUT = args.timeout
+
+    if args.mirror:
+        import mirror
+        mirror.MIRROR_ENABLED = True
+
+    if args.parser is not None:
+        import book_parser
+        book_parser.PARSER_BACKEND = args.parser
+    if args.parse_workers:
+        import parse_pool
+        parse_pool.PARSE_WORKERS = args.parse_workers
+
+    if args.min_confidence is not None:
+        import resolver
+        resolver.MIN_CONFIDENCE = args.min_confidence
+
+    if args.cover_store:
+        import cover_store
+        cover_store.COVER_STORE_ENABLED = True
+
+    if args.no_cache:
+        import http_cache
+        http_cache.CACHE_ENABLED = False
+
+    if args.fixed_rates:
+        import rate_limiter
+        rate_limiter.ADAPTIVE = False
+
+    if args.profile or args.metrics_json is not None:
+        import metrics
+        metrics.enable()
+
+def main():
+    args = build_parser().parse_args()
+
+    command = next((run for name, run in COMMANDS if getattr(args, name)), None)
+    if command is None:
         print("No valid command provided. Use --help for usage information.")
+        return
+
+    configure(args)
+    try:
+        command(args)
+    finally:
+        # Only a command that parsed Goodreads pages can have started the parse pool
+        if 'parse_pool' in sys.modules:
+            sys.modules['parse_pool'].shutdown()
+        # Report whatever was measured, even if the run was interrupted
+        if args.profile or args.metrics_json:
+            import metrics
+            if args.profile:
+                print(metrics.format_report())
+            if args.metrics_json:
+                metrics.write_json(args.metrics_json)
 
 if __name__ == "__main__":
     main()
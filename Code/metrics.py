@@ -0,0 +1,122 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Set by enable() (main.py does so for --profile/--metrics_json); while False the
+# timers and counters below return immediately
+ENABLED = False
+
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_gauges = {}
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _gauges.clear()
+
+def record(stage, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        _timings.setdefault(stage, []).append(seconds)
+
+@contextmanager
+def timer(stage):
+    """
+    Time the body of a with-block as one call of `stage`.
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def count(name, amount=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def gauge(name, value):
+    # Latest value of a level that moves during the run, such as a host's current rate limit
+    if not ENABLED:
+        return
+    with _lock:
+        _gauges[name] = value
+
+def take_timings():
+    """
+    Remove and return the raw timings recorded so far, e.g. to send them from a worker
+    process to the parent, which adds them with merge_timings().
+    """
+    with _lock:
+        timings = dict(_timings)
+        _timings.clear()
+    return timings
+
+def merge_timings(timings):
+    if not ENABLED or not timings:
+        return
+    with _lock:
+        for stage, values in timings.items():
+            _timings.setdefault(stage, []).extend(values)
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def snapshot():
+    """
+    Summarize everything recorded so far: per-stage call counts, totals and p50/p95/max in
+    seconds, plus the counters and the latest value of each gauge.
+    """
+    with _lock:
+        timings = {stage: sorted(values) for stage, values in _timings.items()}
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    stages = {}
+    for stage, values in timings.items():
+        stages[stage] = {
+            'calls': len(values),
+            'total': sum(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'max': values[-1],
+        }
+    return {'stages': stages, 'counters': counters, 'gauges': gauges}
+
+def format_report(summary=None):
+    summary = summary or snapshot()
+    lines = [f"{'stage':<12} {'calls':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+    lines.append('-' * len(lines[0]))
+    for stage, s in sorted(summary['stages'].items(), key=lambda item: -item[1]['total']):
+        lines.append(f"{stage:<12} {s['calls']:>7} {s['total']:>9.2f} {s['p50'] * 1000:>9.1f} "
+                     f"{s['p95'] * 1000:>9.1f} {s['max'] * 1000:>9.1f}")
+    if summary['counters']:
+        lines.append('')
+        width = max(len(name) for name in summary['counters'])
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"{name:<{width}} {value:>12,}")
+    if summary.get('gauges'):
+        lines.append('')
+        width = max(len(name) for name in summary['gauges'])
+        for name, value in sorted(summary['gauges'].items()):
+            lines.append(f"{name:<{width}} {value:>12}")
+    return '\n'.join(lines)
+
+def write_json(path, summary=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary or snapshot(), f, indent=2)
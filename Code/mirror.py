@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import notion_api
+from notion_api import query_database
+
+MIRROR_PATH = os.path.join('.bookdb', 'mirror.sqlite')
+
+# Set from --mirror; when False every lookup goes straight to the Notion API
+MIRROR_ENABLED = False
+
+# Seconds between checks for pages deleted from the database. Incremental syncs only see
+# pages edited since the last one, and Notion leaves archived pages out of queries, so
+# deletions are found by comparing every page ID in the database with the mirror's.
+RECONCILE_INTERVAL = 24 * 60 * 60
+
+class NotionMirror:
+    """
+    Local SQLite copy of the book database's pages, indexed on Name, ID and Author.
+    Each page is stored as the JSON object returned by the Notion API, so callers get the
+    same structure whether a page came from the mirror or from a query.
+    """
+    def __init__(self, path=MIRROR_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                goodreads_id TEXT,
+                author_key TEXT,
+                last_edited_time TEXT NOT NULL,
+                page_json TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_name ON pages (name_key);
+            CREATE INDEX IF NOT EXISTS pages_goodreads_id ON pages (goodreads_id);
+            CREATE INDEX IF NOT EXISTS pages_author ON pages (author_key);
+            CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.conn.commit()
+
+    def store(self, page, commit=True):
+        """
+        Insert or replace a page object; archived pages are removed instead.
+        """
+        with self.lock:
+            if page.get("archived") or page.get("in_trash"):
+                self.conn.execute("DELETE FROM pages WHERE page_id = ?", (page["id"],))
+            else:
+                name = rich_text_value(page, "Name", "title")
+                author = rich_text_value(page, "Author", "rich_text")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (page["id"], name, name.casefold(), rich_text_value(page, "ID", "rich_text") or None,
+                     author.casefold() or None, page["last_edited_time"], json.dumps(page))
+                )
+            if commit:
+                self.conn.commit()
+
+    def store_written(self, page):
+        """
+        Store the page object Notion returned for a write, so the mirror sees the tool's own
+        changes without waiting for the next sync.
+        """
+        if "properties" in page and "last_edited_time" in page:
+            self.store(page)
+
+    def sync(self, full=False):
+        """
+        Bring the mirror up to date. Only pages edited since the newest last_edited_time
+        already stored are requested, and every RECONCILE_INTERVAL the mirror's page IDs are
+        checked against the database's to drop deleted pages. A full sync re-reads the whole
+        database.
+        """
+        last_synced = None if full else self.get_state("last_edited_time")
+        filter = None
+        if last_synced is not None:
+            filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": last_synced}}
+
+        if full:
+            with self.lock:
+                self.conn.execute("DELETE FROM pages")
+        if last_synced is None:
+            # Reading the whole database leaves nothing deleted behind
+            self.set_state("reconciled_at", str(time.time()))
+        elif time.time() - float(self.get_state("reconciled_at") or 0) >= RECONCILE_INTERVAL:
+            self.reconcile()
+
+        newest = last_synced
+        count = 0
+        for page in query_database(filter=filter):
+            self.store(page, commit=False)
+            count += 1
+            if newest is None or page["last_edited_time"] > newest:
+                newest = page["last_edited_time"]
+
+        if newest is not None:
+            self.set_state("last_edited_time", newest)
+        with self.lock:
+            self.conn.commit()
+        return count
+
+    def reconcile(self):
+        """
+        Remove mirrored pages that are no longer in the database. Only the title property is
+        requested, to list every page ID cheaply. Returns the number of pages removed.
+        """
+        page_ids = {page["id"] for page in query_database(filter_properties=["title"])}
+        with self.lock:
+            mirrored = [row[0] for row in self.conn.execute("SELECT page_id FROM pages")]
+            deleted = [page_id for page_id in mirrored if page_id not in page_ids]
+            self.conn.executemany("DELETE FROM pages WHERE page_id = ?", ((page_id,) for page_id in deleted))
+        self.set_state("reconciled_at", str(time.time()))
+        with self.lock:
+            self.conn.commit()
+        return len(deleted)
+
+    def get_state(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+    def select(self, where, params=(), limit=None):
+        query = "SELECT page_json FROM pages WHERE " + where + " ORDER BY name_key"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_by_title(self, title):
+        return self.select("name_key = ?", (title.casefold(),))
+
+    def find_by_id(self, goodreads_id):
+        return self.select("goodreads_id = ?", (goodreads_id,))
+
+    def find_by_author(self, author):
+        return self.select("author_key = ?", (author.casefold(),))
+
+    def search_titles(self, prefix, limit=10):
+        """
+        Case-insensitive prefix search on the Name column, served from the name index.
+        """
+        key = prefix.casefold()
+        # Range scan instead of LIKE so the index is used regardless of LIKE's collation rules
+        return self.select("name_key >= ? AND name_key < ?", (key, key + '\U0010ffff'), limit)
+
+    def iter_pages(self, has_id=None):
+        """
+        Yield mirrored pages, optionally only those with (True) or without (False) a Goodreads ID.
+        """
+        where = "1"
+        if has_id is True:
+            where = "goodreads_id IS NOT NULL"
+        elif has_id is False:
+            where = "goodreads_id IS NULL"
+        with self.lock:
+            cursor = self.conn.execute("SELECT page_json FROM pages WHERE " + where)
+        # Read in batches so memory stays flat however large the database is
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                yield json.loads(row[0])
+
+def rich_text_value(page, name, kind):
+    # Plain text of a title or rich_text property, or '' if it is empty
+    values = page.get("properties", {}).get(name, {}).get(kind) or []
+    return values[0].get("text", {}).get("content", "") if values else ""
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+def get_mirror():
+    """
+    Return the process-wide mirror, syncing it incrementally the first time it is used.
+    From then on, every page the tool writes is stored in it as Notion returns it.
+    """
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = NotionMirror()
+            _mirror.sync()
+            notion_api.write_listeners.append(_mirror.store_written)
+        return _mirror
+
+def find_page_by_title(title):
+    """
+    Look a title up in the mirror (case-insensitively), falling back to the Notion API on a miss.
+    """
+    if MIRROR_ENABLED:
+        pages = get_mirror().find_by_title(title)
+        if pages:
+            return pages
+    pages = notion_api.find_page_by_title(title)
+    if MIRROR_ENABLED:
+        for page in pages:
+            get_mirror().store(page)
+    return pages
+
+def find_page_by_id(goodreads_id):
+    """
+    Look a Goodreads ID up in the mirror, falling back to the Notion API on a miss.
+    """
+    if MIRROR_ENABLED:
+        pages = get_mirror().find_by_id(goodreads_id)
+        if pages:
+            return pages
+    pages = notion_api.find_page_by_id(goodreads_id)
+    if MIRROR_ENABLED:
+        for page in pages:
+            get_mirror().store(page)
+    return pages
+
+def suggest_titles(prefix, limit=5):
+    """
+    Titles starting with the given text, for "did you mean" prompts. Empty without the mirror.
+    """
+    if not MIRROR_ENABLED:
+        return []
+    return [rich_text_value(page, "Name", "title") for page in get_mirror().search_titles(prefix, limit)]
+
+def database_pages(filter=None):
+    """
+    Stream database pages from the mirror when it is enabled, otherwise from the API.
+    The mirror answers the ID_IS_EMPTY and ID_IS_NOT_EMPTY filters locally.
+    """
+    if MIRROR_ENABLED and filter in (None, notion_api.ID_IS_EMPTY, notion_api.ID_IS_NOT_EMPTY):
+        has_id = None if filter is None else filter == notion_api.ID_IS_NOT_EMPTY
+        return get_mirror().iter_pages(has_id)
+    return query_database(filter=filter)
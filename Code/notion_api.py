@@ -1,15 +1,62 @@
-from notion_client import Client
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from notion_client import Client, APIResponseError
 from config import NOTION_TOKEN, DATABASE_ID
-from utilities import parse_date
+from rate_limiter import limited, retry_after_seconds, NOTION_HOST
+import metrics
 
-notion_client = Client(auth=NOTION_TOKEN)
+# Built by get_client() on first use, so importing this module does not create a client
+notion_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global notion_client
+    if notion_client is None:
+        with _client_lock:
+            if notion_client is None:
+                notion_client = Client(auth=NOTION_TOKEN)
+    return notion_client
+
+# Server-side filters on the Goodreads ID column, for use with query_database
+ID_IS_EMPTY = {"property": "ID", "rich_text": {"is_empty": True}}
+ID_IS_NOT_EMPTY = {"property": "ID", "rich_text": {"is_not_empty": True}}
+
+def query_database(filter=None, page_size=100, filter_properties=None):
+    """
+    Yield every page in the database, following has_more/next_cursor across requests.
+    The next batch of results is requested on a background thread while the caller
+    works through the current one, so only two batches are ever held in memory.
+    `filter_properties` limits the properties returned to the given property IDs.
+    """
+    def fetch(cursor):
+        query = {"database_id": DATABASE_ID, "page_size": page_size}
+        if filter is not None:
+            query["filter"] = filter
+        if filter_properties is not None:
+            query["filter_properties"] = filter_properties
+        if cursor is not None:
+            query["start_cursor"] = cursor
+        return notion_request('query', get_client().databases.query, **query)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(fetch, None)
+        while pending is not None:
+            response = pending.result()
+            if response.get("has_more") and response.get("next_cursor"):
+                pending = executor.submit(fetch, response["next_cursor"])
+            else:
+                pending = None
+            yield from response.get("results", [])
 
 def find_page_by_title(title):
     """
     Query the database for a page with a specific 'Title' (or 'Name').
     """
     try:
-        query_results = notion_client.databases.query(
+        query_results = notion_request(
+            'query', get_client().databases.query,
             database_id=DATABASE_ID,
             filter={
                 "property": "Name",  # This targets the main title of a database entry. Adjust if your schema is different.
@@ -28,7 +75,8 @@ def find_page_by_id(id):
     Query the database for a page with a specific 'Title' (or 'Name').
     """
     try:
-        query_results = notion_client.databases.query(
+        query_results = notion_request(
+            'query', get_client().databases.query,
             database_id=DATABASE_ID,
             filter={
                 "property": "ID",
@@ -42,6 +90,65 @@ def find_page_by_id(id):
         print(f"An error occurred: {e}")
         return []
 
+# Attempts made for a Notion call that keeps being answered with 429 Too Many Requests
+MAX_WRITE_RETRIES = 5
+
+def send_page_update(page_id, payload):
+    """
+    Send a pages.update, retrying with jittered exponential backoff while Notion rate-limits us.
+    Other errors, and a 429 on the final attempt, are raised to the caller.
+    """
+    return send_write(get_client().pages.update, page_id=page_id, **payload)
+
+def send_page_create(title, payload):
+    """
+    Create a page titled `title` in the database with the given build_update_payload()
+    payload, retrying like send_page_update.
+    """
+    properties = dict(payload.get("properties", {}))
+    properties["Name"] = {"title": [{"text": {"content": title}}]}
+    return send_write(get_client().pages.create, parent={"database_id": DATABASE_ID},
+                      **dict(payload, properties=properties))
+
+def send_write(method, **arguments):
+    # Shared by send_page_update and send_page_create
+    response = notion_request('write', method, **arguments)
+    remember_written_options(arguments)
+    page_written(response)
+    return response
+
+# Callables given the page object Notion returns for every successful write; the local
+# mirror registers one to keep its copy of written pages current
+write_listeners = []
+
+def page_written(page):
+    for listener in write_listeners:
+        listener(page)
+
+def notion_request(stage, method, **arguments):
+    """
+    Make one Notion API call, timed as `stage`, once the rate limiter allows it, and report
+    how it went (status, Retry-After) so the limits on Notion adapt. A 429 is retried after
+    Retry-After, or with jittered exponential backoff; other errors, and a 429 on the final
+    attempt, are raised to the caller.
+    """
+    for attempt in range(MAX_WRITE_RETRIES):
+        try:
+            with limited(NOTION_HOST) as outcome:
+                try:
+                    with metrics.timer(stage):
+                        response = method(**arguments)
+                except APIResponseError as e:
+                    outcome.report(e.status, getattr(e, 'headers', None))
+                    raise
+                outcome.report(200)
+                return response
+        except APIResponseError as e:
+            if e.status != 429 or attempt == MAX_WRITE_RETRIES - 1:
+                raise
+            metrics.count('notion retries')
+            time.sleep(retry_after_seconds(getattr(e, 'headers', None)) or 2 ** attempt + random.uniform(0, 1))
+
 """
     Update a Notion page with given values for text, number, and multi-select properties.
 
@@ -52,8 +159,25 @@ def find_page_by_id(id):
         multi_select_values (list): A list of strings representing the new values for the multi-select property.
 """
 def update_page(page_id, series=None, rating=None, num_ratings=None, page_cnt=None, genres=None, pub_date=None,
-               summary=None, author=None, pid=None, cover=None, sort_author=None):
+               summary=None, author=None, pid=None, cover=None, sort_author=None, create_genres=False):
+
+    update_payload = build_update_payload(series, rating, num_ratings, page_cnt, genres, pub_date,
+                                          summary, author, pid, cover, sort_author, create_genres)
+
+    # Make the API request to update the page, reporting whether it succeeded
+    try:
+        send_page_update(page_id, update_payload)
+        return True
+    except Exception as e:
+        print(f"Failed to update page: {str(e)}")
+        return False
 
+def build_update_payload(series=None, rating=None, num_ratings=None, page_cnt=None, genres=None, pub_date=None,
+                         summary=None, author=None, pid=None, cover=None, sort_author=None, create_genres=False):
+    """
+    Build the pages.update arguments for the given property values; see update_page.
+    Genres that are not already options of the database are dropped unless create_genres is set.
+    """
     # Prepare the properties payload
     data = {}
 
@@ -88,7 +212,8 @@ def update_page(page_id, series=None, rating=None, num_ratings=None, page_cnt=No
         }
 
     if genres is not None:
-        genres = list(set(genres).intersection(fetch_genres_options(DATABASE_ID)))
+        if not create_genres:
+            genres = [genre for genre in dict.fromkeys(genres) if genre in get_property_options("Genres")]
         data["Genres"] = {
             "type": "multi_select",
             "multi_select": [{"name": value} for value in genres]
@@ -96,7 +221,7 @@ def update_page(page_id, series=None, rating=None, num_ratings=None, page_cnt=No
 
     if pub_date is not None:
         # Format the date to include only the date part (YYYY-MM-DD)
-        formatted_date = parse_date(pub_date).date().isoformat()
+        formatted_date = pub_date.isoformat()[:10]
         data["Publication Date"] = {
             "date": {
             "start": formatted_date,
@@ -133,15 +258,58 @@ def update_page(page_id, series=None, rating=None, num_ratings=None, page_cnt=No
             }
         }
 
-    # Make the API request to update the page
-    try:
-        update_payload = {"properties": data}
-        if cover_data:
-            update_payload.update(cover_data)  # Include cover data if available
+    update_payload = {"properties": data}
+    if cover_data:
+        update_payload.update(cover_data)  # Include cover data if available
+    return update_payload
 
-        response = notion_client.pages.update(page_id=page_id, **update_payload)
-    except Exception as e:
-        print(f"Failed to update page: {str(e)}")
+class WriteQueue:
+    """
+    Collects property updates per page, merging repeated updates to the same page, and
+    writes them once flush_size pages are pending (and on a final flush()). Counts of
+    skipped, updated and failed pages are kept for the end-of-run summary, and each
+    outcome is recorded in the RunJournal, if one is given, once it is final.
+    """
+    def __init__(self, flush_size=25, journal=None):
+        self.flush_size = flush_size
+        self.journal = journal
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.skipped = 0
+        self.updated = 0
+        self.failed = []
+
+    def skip(self, page_id=None):
+        with self.lock:
+            self.skipped += 1
+        if self.journal is not None and page_id is not None:
+            self.journal.record(page_id, 'unchanged')
+
+    def enqueue(self, page_id, **properties):
+        with self.lock:
+            self.pending.setdefault(page_id, {}).update(properties)
+            ready = len(self.pending) >= self.flush_size
+        if ready:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        for page_id, properties in batch.items():
+            try:
+                send_page_update(page_id, build_update_payload(**properties))
+                with self.lock:
+                    self.updated += 1
+                if self.journal is not None:
+                    self.journal.record(page_id, 'updated')
+            except Exception as e:
+                with self.lock:
+                    self.failed.append((page_id, e))
+                if self.journal is not None:
+                    self.journal.record(page_id, 'failed', str(e))
+
+    def summary(self):
+        return f"{self.skipped} unchanged page(s) skipped, {self.updated} updated, {len(self.failed)} failed"
 
 def get_all_ids():
     """
@@ -149,10 +317,7 @@ def get_all_ids():
     """
     ids = []
     try:
-        query_results = notion_client.databases.query(
-            database_id=DATABASE_ID
-        )
-        for page in query_results.get("results", []):
+        for page in query_database(filter=ID_IS_NOT_EMPTY):
             id_property = page["properties"].get("ID", {}).get("rich_text", [{}])
             if id_property:
                 id_value = id_property[0].get("text", {}).get("content", "")
@@ -162,30 +327,103 @@ def get_all_ids():
         print(f"An error occurred: {e}")
     return ids
 
-def fetch_genres_options(database_id):
-    # Fetch the database metadata
-    database_metadata = notion_client.databases.retrieve(database_id=database_id)
+# Seconds the cached database schema is trusted before it is retrieved again
+SCHEMA_TTL = 3600
 
-    # Extract properties from the database metadata
-    properties = database_metadata.get("properties", {})
+_schema = None
+_schema_lock = threading.Lock()
 
-    # Extract the "Genres" multi-select property
-    genres_property = properties.get("Genres")
+def get_database_schema(refresh=False):
+    """
+    Return the database's properties, loaded with a single databases.retrieve per process
+    (or once the copy is older than SCHEMA_TTL). The options of every select and
+    multi-select property are kept as sets under "options" for constant-time lookups.
+    """
+    global _schema
+    with _schema_lock:
+        if refresh or _schema is None or time.monotonic() - _schema["loaded_at"] > SCHEMA_TTL:
+            database = notion_request('schema', get_client().databases.retrieve, database_id=DATABASE_ID)
+            properties = database.get("properties", {})
+            _schema = build_schema(properties)
+        return _schema
+
+def build_schema(properties):
+    options = {}
+    for name, prop in properties.items():
+        if prop.get("type") in ("select", "multi_select"):
+            options[name] = {option["name"] for option in prop[prop["type"]].get("options", [])}
+    return {"properties": properties, "options": options, "loaded_at": time.monotonic()}
+
+def set_database_schema(properties):
+    """
+    Fill the schema cache from properties retrieved elsewhere (e.g. by the async engine).
+    """
+    global _schema
+    with _schema_lock:
+        _schema = build_schema(properties)
+
+def invalidate_schema_cache():
+    """
+    Forget the cached schema so the next lookup retrieves it from Notion again.
+    """
+    global _schema
+    with _schema_lock:
+        _schema = None
+
+def get_property_options(name):
+    """
+    Return the set of option names of a select or multi-select property, from the schema cache.
+    """
+    options = get_database_schema()["options"].get(name)
+    if options is None:
+        print(f"The '{name}' property is not found or not a select type.")
+        return set()
+    return options
+
+def add_property_options(name, values):
+    """
+    Record options that were created by a write, so the cache stays current without a refetch.
+    """
+    with _schema_lock:
+        if _schema is not None:
+            _schema["options"].setdefault(name, set()).update(values)
+
+def remember_written_options(payload):
+    # Notion creates any multi-select option it has not seen; remember them
+    for name, value in payload.get("properties", {}).items():
+        if value.get("type") == "multi_select":
+            add_property_options(name, [option["name"] for option in value["multi_select"]])
+
+def schema_is_current():
+    with _schema_lock:
+        return _schema is not None and time.monotonic() - _schema["loaded_at"] <= SCHEMA_TTL
+
+def fetch_genres_options(database_id=None):
+    """
+    Names of the Genres options, sorted, from the schema cache (so loaded through
+    notion_request at most once per SCHEMA_TTL). database_id is accepted for existing callers;
+    the options are always those of the configured database.
+    """
+    return sorted(get_property_options("Genres"))
+
+def refresh_changes(page, packet):
+    """
+    Compare a scraped BookMetadata packet with the values already on a queried page object and
+    return the refresh_with_packet properties that differ, as update_page keyword arguments.
+    """
+    properties = page.get("properties", {})
+
+    changes = {}
+    if properties.get("Goodreads Rating", {}).get("number") != packet.rating:
+        changes['rating'] = packet.rating
+    if properties.get("Number of Ratings", {}).get("number") != packet.num_ratings:
+        changes['num_ratings'] = packet.num_ratings
+    return changes
 
-    # Check if "Genres" is indeed a multi-select property
-    if genres_property and genres_property.get("type") == "multi_select":
-        # Extract and return the options
-        options = genres_property["multi_select"]["options"]
-        return [option["name"] for option in options]
-    else:
-        print("The 'Genres' property is not found or not a multi-select type.")
-        return []
-    
 def refresh_with_packet(page_id, packet):
-    update_page(page_id, rating=float(packet.get('rating')), num_ratings=int(packet.get('num ratings').replace(',', '')))
+    return update_page(page_id, rating=packet.rating, num_ratings=packet.num_ratings)
 
 def update_with_packet(page_id, packet):
-    update_page(page_id, packet.get('series'), float(packet.get('rating')),
-                int(packet.get('num ratings').replace(',', '')), int(packet.get('pages').strip(',')),
-                packet.get('genres'), packet.get('publication date'), packet.get('summary'), packet.get('author'),
-                packet.get('pid'), packet.get('cover'), packet.get('sort author'))
+    return update_page(page_id, packet.series, packet.rating, packet.num_ratings, packet.pages, list(packet.genres),
+                       packet.publication_date, packet.summary, packet.author, packet.pid, packet.cover,
+                       packet.sort_author)
@@ -0,0 +1,83 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import book_parser
+import metrics
+from book_metadata import BookMetadata
+
+# Processes parsing book pages; 0 parses in the calling thread. main.py sets this from --parse_workers
+PARSE_WORKERS = 0
+
+def init_worker(backend, metrics_enabled):
+    # Child processes start from the parent's settings, however they were started
+    book_parser.PARSER_BACKEND = backend
+    metrics.enable(metrics_enabled)
+
+def parse_in_worker(data, encoding, book_id):
+    """
+    Runs in a pool process: decode and parse one book page, and return the compact form of
+    its BookMetadata along with the timings the parse recorded.
+    """
+    record = book_parser.parse_book_page(data.decode(encoding, errors='replace'), book_id)
+    return record.to_compact(), metrics.take_timings()
+
+class ParsePool:
+    """
+    Process pool for the CPU-bound parse stage of a scrape. Pages go in as raw bytes and come
+    back as BookMetadata records. At most max_pending pages wait in the pool at once: parse()
+    blocks until there is room, so fetchers cannot run ahead and pile pages up in memory.
+    """
+    def __init__(self, workers, max_pending=None):
+        # The pool is first used from a --workers thread while others are mid-request; a
+        # forked child would inherit locks those threads hold (metrics', the HTTP pool's)
+        # and could hang on them, so children are spawned fresh and set up by init_worker
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker,
+                                            initargs=(book_parser.PARSER_BACKEND, metrics.ENABLED))
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 2)
+
+    def parse(self, data, encoding, book_id):
+        with metrics.timer('parse wait'):
+            self.slots.acquire()
+        try:
+            future = self.executor.submit(parse_in_worker, data, encoding, book_id)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        compact, timings = future.result()
+        metrics.merge_timings(timings)
+        return BookMetadata.from_compact(compact)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    Return the shared pool, starting it on first use, or None when PARSE_WORKERS is 0.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and PARSE_WORKERS > 0:
+            _pool = ParsePool(PARSE_WORKERS)
+        return _pool
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+def parse_book_response(response, book_id):
+    """
+    Parse stage of scrape_book_info: parse a fetched book page in the pool when one is
+    configured, otherwise in the calling thread.
+    """
+    pool = get_pool()
+    if pool is None:
+        return book_parser.parse_book_page(response.text, book_id)
+    return pool.parse(response.content, getattr(response, 'encoding', None) or 'utf-8', book_id)
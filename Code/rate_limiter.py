@@ -0,0 +1,413 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import metrics
+
+GOODREADS_HOST = 'www.goodreads.com'
+NOTION_HOST = 'api.notion.com'
+
+# Sustained requests per second allowed for each host. Notion documents an average of
+# three requests per second per integration; Goodreads publishes no limit, so stay polite.
+DEFAULT_RATES = {
+    GOODREADS_HOST: 2.0,
+    NOTION_HOST: 3.0,
+}
+# Rate used for any host without an explicit entry above
+FALLBACK_RATE = 1.0
+
+# Hosts whose rate and requests in flight are tuned while a run goes (see AdaptiveLimit):
+# the range the rate may move in, and the starting and largest number of requests in flight.
+# The rate starts from DEFAULT_RATES. main.py clears ADAPTIVE for --fixed_rates.
+ADAPTIVE = True
+ADAPTIVE_LIMITS = {
+    GOODREADS_HOST: {'min_rate': 0.5, 'max_rate': 8.0, 'concurrency': 4, 'max_concurrency': 32},
+    NOTION_HOST: {'min_rate': 1.0, 'max_rate': 6.0, 'concurrency': 3, 'max_concurrency': 16},
+}
+# Requests per second added to the rate per second of healthy responses at full speed
+RATE_INCREASE = 0.2
+# Factor applied to the rate and concurrency on a 429, a 5xx or a connection error, and on latency
+# rising past LATENCY_TOLERANCE times its baseline; at most once per DECREASE_COOLDOWN seconds
+THROTTLE_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+LATENCY_TOLERANCE = 2.0
+DECREASE_COOLDOWN = 1.0
+# Longest Retry-After pause honoured, in seconds
+MAX_PAUSE = 60.0
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second up to
+    `capacity`, and acquire() blocks the calling thread until enough tokens are available.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        """
+        Take the tokens if they are available and return 0, otherwise return roughly how
+        many seconds the deficit takes to refill (or the bucket stays paused).
+        """
+        with self.lock:
+            paused = self.paused_until - time.monotonic()
+            if paused > 0:
+                return paused
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def set_rate(self, rate):
+        # Change the refill rate in place; tokens already earned are kept
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = max(1.0, self.rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds):
+        # Hand out no tokens for the next `seconds`, e.g. as asked by a Retry-After header
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens=1):
+        # Sleep outside the lock until the bucket can cover the request
+        wait = self.reserve(tokens)
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve(tokens)
+
+    async def acquire_async(self, tokens=1):
+        wait = self.reserve(tokens)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.reserve(tokens)
+
+class AdaptiveLimit:
+    """
+    AIMD control of one host's request rate and requests in flight. Each healthy response
+    raises the rate by about RATE_INCREASE per second and the concurrency by one per full
+    window of requests; a 429, a 5xx, a connection error or a Retry-After cuts both by
+    THROTTLE_DECREASE, and latency climbing well above its baseline trims them by
+    LATENCY_DECREASE. The rate is applied to the host's TokenBucket, and enter()/leave()
+    bound the requests in flight. The current limits are published as metrics gauges.
+
+    Asyncio callers wait on a future of their own loop; a freed slot is handed straight to
+    the longest-waiting one, from whichever thread frees it, so none of them has to poll.
+    """
+    def __init__(self, host, min_rate, max_rate, concurrency, max_concurrency, min_concurrency=1):
+        self.host = host
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(get_bucket(host).rate, min_rate), max_rate)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(concurrency)
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        # (loop, future) of each asyncio caller waiting for a slot, oldest first
+        self.async_waiters = deque()
+        self.publish()
+
+    def try_enter(self):
+        with self.condition:
+            if self.in_flight < int(self.concurrency):
+                self.in_flight += 1
+                return True
+            return False
+
+    def enter(self):
+        with self.condition:
+            while self.in_flight >= int(self.concurrency):
+                self.condition.wait()
+            self.in_flight += 1
+
+    async def enter_async(self):
+        with self.condition:
+            if self.in_flight < int(self.concurrency):
+                self.in_flight += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            entry = (loop, waiter)
+            self.async_waiters.append(entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self.condition:
+                handed = entry not in self.async_waiters
+                if not handed:
+                    self.async_waiters.remove(entry)
+            # A slot handed over before the cancellation landed is given back here, or by
+            # hand_over() if the future was cancelled first
+            if handed and waiter.done() and not waiter.cancelled():
+                self.leave()
+            raise
+
+    def wake_async(self):
+        # Hand free slots to waiting asyncio callers; called with the condition held
+        while self.async_waiters and self.in_flight < int(self.concurrency):
+            loop, waiter = self.async_waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self.hand_over, waiter)
+            except RuntimeError:
+                # The waiter's loop has closed
+                self.in_flight -= 1
+
+    def hand_over(self, waiter):
+        # Runs on the waiter's loop
+        if waiter.cancelled():
+            self.leave()
+        else:
+            waiter.set_result(None)
+
+    def leave(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.wake_async()
+            self.condition.notify()
+
+    def observe(self, status, seconds, retry_after=None, throttled=False):
+        """
+        Adjust the limits for one finished request: its final HTTP status (None if it failed
+        to connect or complete), how long it took, the Retry-After it carried, and whether
+        it was throttled on the way (e.g. a 429 that urllib3 retried).
+        """
+        bucket = get_bucket(self.host)
+        if retry_after:
+            bucket.pause(min(retry_after, MAX_PAUSE))
+        with self.condition:
+            before = int(self.concurrency)
+            if throttled or retry_after or status is None or status == 429 or status >= 500:
+                metrics.count('throttled responses')
+                self.decrease(THROTTLE_DECREASE)
+            elif self.latency_rising(seconds):
+                self.decrease(LATENCY_DECREASE)
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_INCREASE / self.rate)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            if int(self.concurrency) > before:
+                self.wake_async()
+                self.condition.notify_all()
+            rate = self.rate
+        # A controller dropped by set_rate() must leave the fixed bucket alone
+        with _buckets_lock:
+            current = _controllers.get(self.host) is self
+        if current:
+            bucket.set_rate(rate)
+            self.publish()
+
+    def latency_rising(self, seconds):
+        # Fast moving average of latency against a baseline that follows the lowest latencies
+        # at once and higher ones only slowly, so a sustained climb stands out
+        if self.latency is None:
+            self.latency = self.baseline = seconds
+            return False
+        self.latency += 0.2 * (seconds - self.latency)
+        self.baseline = min(seconds, self.baseline + 0.01 * (seconds - self.baseline))
+        return self.latency > LATENCY_TOLERANCE * self.baseline
+
+    def decrease(self, factor):
+        # One cut per cooldown, so a burst of errors from the same window counts once
+        now = time.monotonic()
+        if now - self.last_decrease < DECREASE_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.concurrency = max(self.min_concurrency, self.concurrency * factor)
+
+    def publish(self):
+        metrics.gauge(f"{self.host} rate/s", round(self.rate, 2))
+        metrics.gauge(f"{self.host} concurrency", int(self.concurrency))
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_controllers = {}
+_fixed_hosts = set()
+
+def get_bucket(host):
+    """
+    Return the shared bucket for a host, creating it from DEFAULT_RATES on first use.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(DEFAULT_RATES.get(host, FALLBACK_RATE))
+            _buckets[host] = bucket
+        return bucket
+
+def get_controller(host):
+    """
+    Return the AdaptiveLimit for a host, creating it on first use, or None if the host is
+    not in ADAPTIVE_LIMITS, its rate was fixed with set_rate(), or ADAPTIVE is off.
+    """
+    if not ADAPTIVE or host not in ADAPTIVE_LIMITS:
+        return None
+    get_bucket(host)
+    with _buckets_lock:
+        if host in _fixed_hosts:
+            return None
+        controller = _controllers.get(host)
+    if controller is None:
+        controller = AdaptiveLimit(host, **ADAPTIVE_LIMITS[host])
+        with _buckets_lock:
+            controller = _controllers.setdefault(host, controller)
+    return controller
+
+def set_rate(host, rate, capacity=None):
+    """
+    Replace the bucket for a host, e.g. to slow down after being throttled. The host's rate
+    then stays fixed: it is no longer under adaptive control.
+    """
+    with _buckets_lock:
+        _buckets[host] = TokenBucket(rate, capacity)
+        _fixed_hosts.add(host)
+        _controllers.pop(host, None)
+
+def reset_rates():
+    """
+    Drop every bucket and controller so each host starts again from DEFAULT_RATES.
+    """
+    with _buckets_lock:
+        _buckets.clear()
+        _controllers.clear()
+        _fixed_hosts.clear()
+
+def host_of(host_or_url):
+    return urlparse(host_or_url).netloc if '://' in host_or_url else host_or_url
+
+def acquire(host_or_url, tokens=1):
+    """
+    Block until a request to the given host (or the host of the given URL) is allowed.
+    """
+    with metrics.timer('throttle'):
+        get_bucket(host_of(host_or_url)).acquire(tokens)
+
+async def acquire_async(host_or_url, tokens=1):
+    """
+    Wait, without blocking the event loop, until a request to the given host is allowed.
+    Shares its buckets with acquire(), so sync and async callers are limited together.
+    """
+    with metrics.timer('throttle'):
+        await get_bucket(host_of(host_or_url)).acquire_async(tokens)
+
+def retry_after_seconds(headers):
+    """
+    Seconds a response's Retry-After header asks us to wait, given as seconds or as an HTTP
+    date, or None if there is no usable header.
+    """
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RequestOutcome:
+    """
+    Yielded by limited() and limited_async(): the request made in the with-block reports
+    its result here for the host's adaptive control.
+    """
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+        self.throttled = False
+        self.reported = False
+
+    def report(self, status, headers=None, throttled=False):
+        self.status = status
+        self.retry_after = retry_after_seconds(headers)
+        self.throttled = throttled
+        self.reported = True
+
+def settle(controller, outcome, started, failed):
+    controller.leave()
+    if outcome.reported or failed:
+        controller.observe(outcome.status, time.monotonic() - started, outcome.retry_after, outcome.throttled)
+
+@contextmanager
+def limited(host_or_url, tokens=1):
+    """
+    Wait until a request to the host is allowed, by its rate limit and, for a host under
+    adaptive control, its limit on requests in flight; the request is then made in the
+    with-block, which should report() its status on the yielded RequestOutcome. An exception
+    leaving the block unreported counts as a failed request.
+    """
+    host = host_of(host_or_url)
+    controller = get_controller(host)
+    with metrics.timer('throttle'):
+        if controller is not None:
+            controller.enter()
+        try:
+            get_bucket(host).acquire(tokens)
+        except BaseException:
+            if controller is not None:
+                controller.leave()
+            raise
+    outcome = RequestOutcome()
+    if controller is None:
+        yield outcome
+        return
+    started = time.monotonic()
+    failed = False
+    try:
+        yield outcome
+    except Exception:
+        failed = True
+        raise
+    finally:
+        settle(controller, outcome, started, failed)
+
+@asynccontextmanager
+async def limited_async(host_or_url, tokens=1):
+    """
+    limited() for asyncio callers: waits without blocking the event loop, sharing the same
+    buckets and controllers as the sync code.
+    """
+    host = host_of(host_or_url)
+    controller = get_controller(host)
+    with metrics.timer('throttle'):
+        if controller is not None:
+            await controller.enter_async()
+        try:
+            await get_bucket(host).acquire_async(tokens)
+        except BaseException:
+            if controller is not None:
+                controller.leave()
+            raise
+    outcome = RequestOutcome()
+    if controller is None:
+        yield outcome
+        return
+    started = time.monotonic()
+    failed = False
+    try:
+        yield outcome
+    except Exception:
+        failed = True
+        raise
+    finally:
+        settle(controller, outcome, started, failed)
@@ -0,0 +1,148 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from journal import FINISHED_OUTCOMES
+
+STATE_PATH = os.path.join('.bookdb', 'refresh_state.sqlite')
+
+# Weight of the latest ratings-per-day reading in a book's volatility; the rest is its history
+VOLATILITY_SMOOTHING = 0.5
+# Refreshes recorded before the state is committed to disk
+COMMIT_EVERY = 100
+
+DAY = 24 * 3600
+
+def edited_timestamp(page):
+    # Notion's last_edited_time, e.g. 2024-01-01T00:00:00.000Z, as a Unix timestamp
+    try:
+        return datetime.fromisoformat(page["last_edited_time"].replace('Z', '+00:00')).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+class RefreshState:
+    """
+    Local record of when each page was last refreshed from Goodreads and how quickly its
+    ratings count has been moving (new ratings per day, smoothed across refreshes). A
+    scrape is only noted by observe(); it is saved once the page's journal outcome shows
+    it was written or needed no change, so a failed write is refreshed again next time.
+    """
+    def __init__(self, path=STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS refresh (
+                page_id TEXT PRIMARY KEY,
+                goodreads_id TEXT,
+                refreshed_at REAL NOT NULL,
+                num_ratings INTEGER,
+                volatility REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.commit()
+        self.observed = {}
+        self.uncommitted = 0
+
+    def rows(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT page_id, refreshed_at, num_ratings, volatility FROM refresh").fetchall()
+        return {page_id: (refreshed_at, num_ratings, volatility) for page_id, refreshed_at, num_ratings, volatility in rows}
+
+    def observe(self, page_id, goodreads_id, num_ratings):
+        with self.lock:
+            self.observed[page_id] = (goodreads_id, num_ratings, time.time())
+
+    def record(self, page_id, outcome, detail=None):
+        """
+        Journal listener: save the observation for a page once its outcome is final.
+        """
+        with self.lock:
+            observation = self.observed.pop(page_id, None)
+            if observation is None or outcome not in FINISHED_OUTCOMES:
+                return
+            goodreads_id, num_ratings, refreshed_at = observation
+            previous = self.conn.execute(
+                "SELECT refreshed_at, num_ratings, volatility FROM refresh WHERE page_id = ?", (page_id,)
+            ).fetchone()
+            volatility = 0.0
+            if previous is not None:
+                volatility = previous[2]
+                days = (refreshed_at - previous[0]) / DAY
+                if days > 0 and num_ratings is not None and previous[1] is not None:
+                    rate = abs(num_ratings - previous[1]) / days
+                    volatility = VOLATILITY_SMOOTHING * rate + (1 - VOLATILITY_SMOOTHING) * volatility
+            self.conn.execute(
+                "INSERT OR REPLACE INTO refresh VALUES (?, ?, ?, ?, ?)",
+                (page_id, goodreads_id, refreshed_at, num_ratings, volatility)
+            )
+            self.uncommitted += 1
+            if self.uncommitted >= COMMIT_EVERY:
+                self.conn.commit()
+                self.uncommitted = 0
+
+    def stale_pages(self, pages, stale_after_days, now=None):
+        """
+        Return the pages not refreshed within stale_after_days, most valuable first. A page's
+        priority is how many stale periods old it is, scaled up by the log of its ratings per
+        day, so a busy new release outranks a classic of the same age. Pages with no local
+        history are dated by their last Notion edit, or put first if that is unknown.
+        """
+        now = time.time() if now is None else now
+        stale_after = stale_after_days * DAY
+        known = self.rows()
+        ranked = []
+        for page in pages:
+            refreshed_at, _, volatility = known.get(page['id'], (edited_timestamp(page), None, 0.0))
+            if refreshed_at is None:
+                priority = math.inf
+            else:
+                age = now - refreshed_at
+                if age < stale_after:
+                    continue
+                priority = age / stale_after * (1 + math.log1p(volatility))
+            ranked.append((priority, page))
+        # sort() is stable, so equal priorities keep the database order
+        ranked.sort(key=lambda item: -item[0])
+        return [page for _, page in ranked]
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+class RefreshBudget:
+    """
+    Caps a run at max_pages refreshed pages and/or max_seconds of wall time, counted from
+    when the budget is created. allow() takes one page from the budget; `stopped` then says
+    which limit ran out.
+    """
+    def __init__(self, max_pages=None, max_seconds=None):
+        self.max_pages = max_pages
+        self.deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        self.handed_out = 0
+        self.stopped = None
+
+    def allow(self):
+        if self.max_pages is not None and self.handed_out >= self.max_pages:
+            self.stopped = 'request'
+            return False
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stopped = 'time'
+            return False
+        self.handed_out += 1
+        return True
+
+    def pages(self, pages, done=None):
+        # Pages for which done(page_id) is true pass through without counting against the budget
+        for page in pages:
+            if done is not None and done(page['id']):
+                yield page
+            elif self.allow():
+                yield page
+            else:
+                return
@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from book_parser import parse_search_results
+from http_cache import cached_get
+
+RESOLVER_PATH = os.path.join('.bookdb', 'resolver.sqlite')
+
+# Search results scored against each title
+SEARCH_RESULTS = 5
+# Matches scoring below this are queued for review instead of being written; main.py sets
+# this from --min_confidence
+MIN_CONFIDENCE = 0.8
+# Share of the score given to the title when the database also knows the author
+TITLE_WEIGHT = 0.75
+
+SERIES_SUFFIX = re.compile(r'\s*\([^)]*#[^)]*\)\s*$')
+SUBTITLE_SEPARATOR = re.compile(r':| - |, or ')
+# Factor applied to a match on the main title alone, so an exact full title ranks higher
+SUBTITLE_PENALTY = 0.95
+# Factor applied when two strings carry different numbers ("Book 2" and "Book 3", "1984" and "1985")
+NUMBER_PENALTY = 0.6
+NUMBER = re.compile(r'\d+')
+NON_WORD = re.compile(r'[^\w\s]')
+WHITESPACE = re.compile(r'\s+')
+LEADING_ARTICLE = re.compile(r'^(?:the|a|an) ')
+
+def normalize_text(text):
+    # Case, accents, punctuation and spacing removed
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = NON_WORD.sub(' ', text.casefold().replace('&', ' and '))
+    return WHITESPACE.sub(' ', text).strip()
+
+def normalize_title(title):
+    return LEADING_ARTICLE.sub('', normalize_text(title))
+
+def normalize_author(author):
+    # Word order varies ("Le Guin, Ursula K." and "Ursula K. Le Guin"), so compare sorted words
+    return ' '.join(sorted(normalize_text(author).split()))
+
+def match_key(title, author=''):
+    """
+    Key under which a title is searched and remembered, so that the same book queued twice
+    or spelled slightly differently is only looked up once.
+    """
+    return normalize_title(title), normalize_author(author)
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    ratio = SequenceMatcher(None, a, b).ratio()
+    if set(NUMBER.findall(a)) != set(NUMBER.findall(b)):
+        ratio *= NUMBER_PENALTY
+    return ratio
+
+def title_score(title_key, title):
+    # Goodreads titles carry the series, "(The Expanse, #1)", and often a subtitle the database leaves out
+    without_series = SERIES_SUFFIX.sub('', title)
+    main_title = SUBTITLE_SEPARATOR.split(without_series)[0]
+    return max(similarity(title_key, normalize_title(title)),
+               similarity(title_key, normalize_title(without_series)),
+               similarity(title_key, normalize_title(main_title)) * SUBTITLE_PENALTY)
+
+def score_result(key, result):
+    """
+    Score a search result between 0 and 1 against a match key: the best title similarity,
+    blended with the author similarity when the database has an author for the book.
+    """
+    title_key, author_key = key
+    score = title_score(title_key, result['title'])
+    if not author_key:
+        return score
+    author_score = similarity(author_key, normalize_author(result['author']))
+    return TITLE_WEIGHT * score + (1 - TITLE_WEIGHT) * author_score
+
+def search_url(title):
+    return f"https://www.goodreads.com/search?q=\"{title}\""
+
+class ResolverMemo:
+    """
+    SQLite store of resolved matches, keyed by normalized title and author, so titles are
+    not searched again on later runs, and of the low-confidence matches waiting for review.
+    """
+    def __init__(self, path=RESOLVER_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS matches (
+                title_key TEXT NOT NULL,
+                author_key TEXT NOT NULL,
+                goodreads_id TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                title TEXT,
+                author TEXT,
+                source TEXT NOT NULL,
+                candidates TEXT,
+                resolved_at REAL NOT NULL,
+                PRIMARY KEY (title_key, author_key)
+            );
+            CREATE TABLE IF NOT EXISTS review (
+                page_id TEXT PRIMARY KEY,
+                name TEXT,
+                author TEXT,
+                goodreads_id TEXT,
+                confidence REAL,
+                candidates TEXT,
+                queued_at REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def lookup(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT goodreads_id, confidence, title, author, source, candidates FROM matches "
+                "WHERE title_key = ? AND author_key = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        goodreads_id, confidence, title, author, source, candidates = row
+        # Searched matches remembered by earlier versions, or under a lower --min_confidence,
+        # are searched again rather than trusted
+        if source != 'manual' and confidence < MIN_CONFIDENCE:
+            return None
+        return {'id': goodreads_id, 'confidence': confidence, 'title': title, 'author': author,
+                'source': source, 'candidates': json.loads(candidates or '[]')}
+
+    def remember(self, key, resolution):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key[0], key[1], resolution['id'], resolution['confidence'], resolution.get('title'),
+                 resolution.get('author'), resolution.get('source', 'search'),
+                 json.dumps(resolution.get('candidates', [])), time.time())
+            )
+            self.conn.commit()
+
+    def forget_title(self, title_key):
+        # Drop every match remembered for a title, whatever the author
+        with self.lock:
+            self.conn.execute("DELETE FROM matches WHERE title_key = ?", (title_key,))
+            self.conn.commit()
+
+    def queue_review(self, page_id, name, author, resolution):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO review VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (page_id, name, author, resolution['id'], resolution['confidence'],
+                 json.dumps(resolution.get('candidates', [])), time.time())
+            )
+            self.conn.commit()
+
+    def pending_reviews(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page_id, name, author, goodreads_id, confidence, candidates FROM review ORDER BY queued_at"
+            ).fetchall()
+        return [{'page_id': page_id, 'name': name, 'author': author, 'id': goodreads_id,
+                 'confidence': confidence, 'candidates': json.loads(candidates or '[]')}
+                for page_id, name, author, goodreads_id, confidence, candidates in rows]
+
+    def resolve_review(self, page_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM review WHERE page_id = ?", (page_id,))
+            self.conn.commit()
+
+_memo = None
+_memo_lock = threading.Lock()
+
+def get_memo():
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ResolverMemo()
+        return _memo
+
+def search_results(title, limit=SEARCH_RESULTS):
+    """
+    Search Goodreads for a title and return its top results, unscored, in Goodreads' order.
+    """
+    response = cached_get(search_url(title), 'search')
+    if response.status_code != 200:
+        raise ValueError(f"search for {title} failed with HTTP {response.status_code}")
+    return parse_search_results(response.text, limit)
+
+def score_candidates(key, results):
+    candidates = [dict(result, score=round(score_result(key, result), 3)) for result in results]
+    # sorted() is stable, so equal scores keep Goodreads' own ranking
+    return sorted(candidates, key=lambda candidate: -candidate['score'])
+
+def resolve_title(title, author='', searches=None):
+    """
+    Return the best Goodreads match for a title as a dictionary with its 'id', 'confidence',
+    matched 'title' and 'author', 'source' and the scored 'candidates', or None if the search
+    found nothing. Confident matches are remembered, so such a title is only searched once. A `searches`
+    dictionary shares search results between calls for the same title with different authors.
+    """
+    key = match_key(title, author)
+    memo = get_memo()
+    resolution = memo.lookup(key)
+    if resolution is not None:
+        return resolution
+
+    results = searches.get(key[0]) if searches is not None else None
+    if results is None:
+        results = search_results(title)
+        if searches is not None:
+            searches[key[0]] = results
+    return best_match(key, results)
+
+def best_match(key, results):
+    """
+    Score search results against a match key and return the best one as the resolution. Only
+    a match of at least MIN_CONFIDENCE is remembered; a weaker one waits for --review, and the
+    title is searched again next time in case Goodreads has since listed a better match.
+    """
+    candidates = score_candidates(key, results)
+    if not candidates:
+        return None
+    best = candidates[0]
+    resolution = {'id': best['id'], 'confidence': best['score'], 'title': best['title'],
+                  'author': best['author'], 'source': 'search', 'candidates': candidates}
+    if resolution['confidence'] >= MIN_CONFIDENCE:
+        get_memo().remember(key, resolution)
+    return resolution
+
+def remember_choice(title, author, goodreads_id, packet):
+    """
+    Record a match confirmed by hand (via --fix_match or --review) with full confidence.
+    """
+    get_memo().remember(match_key(title, author), {'id': goodreads_id, 'confidence': 1.0, 'title': packet.title,
+                                                   'author': packet.author, 'source': 'manual'})
+
+def correct_choice(title, goodreads_id, packet):
+    """
+    Replace whatever was remembered for a title with a correction made by hand (--fix_match).
+    The wrong match may be remembered under any author, including the one it wrote onto the
+    page, so every match for the title is forgotten; the correction is then remembered for
+    the title alone and for the title with the right book's author.
+    """
+    memo = get_memo()
+    memo.forget_title(normalize_title(title))
+    remember_choice(title, '', goodreads_id, packet)
+    remember_choice(title, packet.author, goodreads_id, packet)
+
+def resolve_titles(entries, workers=1):
+    """
+    Resolve many (title, author) pairs at once. Pairs that normalize to the same title are
+    searched only once; the result maps every match key to its resolution (None for no
+    match, or the exception if the search failed).
+    """
+    groups = {}
+    for title, author in entries:
+        key = match_key(title, author)
+        groups.setdefault(key[0], {}).setdefault(key, (title, author))
+
+    def resolve(group):
+        searches = {}
+        resolutions = {}
+        for key, (title, author) in group.items():
+            try:
+                resolutions[key] = resolve_title(title, author, searches)
+            except Exception as e:
+                resolutions[key] = e
+        return resolutions
+
+    resolutions = {}
+    if workers <= 1:
+        for group_resolutions in map(resolve, groups.values()):
+            resolutions.update(group_resolutions)
+        return resolutions
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for group_resolutions in executor.map(resolve, groups.values()):
+            resolutions.update(group_resolutions)
+    return resolutions
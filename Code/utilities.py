@@ -1,52 +1,61 @@
 import re
+import string
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 from datetime import datetime
+from functools import lru_cache
+
+# Patterns used by process_summary, compiled once at import
+SENTENCE_BREAK = re.compile(r'[.?!](?=[0-9A-Za-z])')
+LEADING_IDENTIFIER = re.compile(r'(ASIN|ISBN) [A-Z0-9]+(?=[A-Z][a-z])')
+PERIOD_RUN = re.compile(r'\.{2,}')
+SPACES_BEFORE_NEWLINE = re.compile(r' +\n')
+NEWLINES_BEFORE_SPACE = re.compile(r'\n+ ')
+ASCII_ALPHANUMERIC = frozenset(string.ascii_letters + string.digits)
+
+def append_newline(match):
+    # re.sub callback; cheaper per match than expanding a template such as r'\1\n'
+    return match.group() + '\n'
 
 def add_newline_after_closing_quote(text):
-    # Split the text into segments by quotation marks
+    if '"' not in text:
+        return text
+
+    # Split the text into segments by quotation marks; odd segments are inside quotes
     segments = text.split('"')
 
-    # Initialize an empty list to hold processed segments
-    processed_segments = []
-
-    # Process each segment
-    for i, segment in enumerate(segments):
-        # If the segment is followed by an even-indexed segment (indicating it's a closing quote)
-        # and the next segment starts with an alphanumeric character, add a newline
-        if i % 2 == 1:  # This means the quote before this segment was an opening quote
-            if i + 1 < len(segments) and re.match(r'^[A-Za-z0-9]', segments[i + 1]):
-                segment += '"\n'  # Add a newline after the closing quote
-            else:
-                segment += '"'  # Otherwise, just reattach the closing quote without a newline
-        elif i + 1 < len(segments):  # For the odd segments, which are outside quotes
-            segment += '"'
-        processed_segments.append(segment)
-
-    # Join the processed segments back together
-    return ''.join(processed_segments)
+    # A closing quote that runs straight into a letter or digit gets a newline after it
+    for i in range(1, len(segments) - 1, 2):
+        if segments[i + 1][:1] in ASCII_ALPHANUMERIC:
+            segments[i + 1] = '\n' + segments[i + 1]
+
+    # An unmatched final quote is closed at the end of the text
+    closing = '"' if len(segments) % 2 == 0 else ''
+    return '"'.join(segments) + closing
 
 def remove_asin_isbn_sentences(text):
-    # Split the text into sentences based on periods
-    sentences = text.split('.')
+    # Split off the first sentence (up to the first period)
+    first, period, rest = text.partition('.')
 
     # Check and remove "ASIN" or "ISBN" from the first sentence if present
-    if sentences and ("ASIN" in sentences[0] or "ISBN" in sentences[0]):
-        sentences[0] = ''  # Remove the first sentence
-        if len(sentences) > 1 and sentences[1].startswith('\n'):
-            sentences[1] = sentences[1].lstrip('\n')  # Remove leading newline from the next sentence
+    if "ASIN" in first or "ISBN" in first:
+        first = ''  # Remove the first sentence
+        rest = rest.lstrip('\n')  # Remove leading newline from the next sentence
 
     # Check and remove "ASIN" or "ISBN" from the last sentence if present
-    if sentences and ("ASIN" in sentences[-1] or "ISBN" in sentences[-1]):
-        if sentences[-1].startswith('\n'):
-            sentences[-1] = sentences[-1].lstrip('\n')  # Remove leading newline from the last sentence
-        sentences[-1] = ''  # Remove the last sentence
+    if period:
+        body, last_period, last = rest.rpartition('.')
+        if "ASIN" in last or "ISBN" in last:
+            rest = body + last_period  # Remove the last sentence
 
-    # Reassemble the text, removing any empty sentences
-    modified_text = '.'.join(sentence for sentence in sentences if sentence).strip('.')
+    # Reassemble the text, collapsing the periods left around any empty sentences
+    modified_text = first + period + rest
+    if '..' in modified_text:
+        modified_text = PERIOD_RUN.sub('.', modified_text)
+    modified_text = modified_text.strip('.')
 
-    # Ensure proper spacing and period placement between sentences
-    modified_text = modified_text.replace('.\n', '.\n ').replace('..', '.').strip()
-
-    return modified_text
+    # Ensure proper spacing after sentences that end a line
+    return modified_text.replace('.\n', '.\n ').strip()
 
 def truncate_string(s):
     # Check if the string length exceeds 2000 characters
@@ -58,42 +67,30 @@ def truncate_string(s):
         return s
 
 def adjust_spaces_around_quotes(text):
-    # Split the text into segments by quotation marks
-    segments = text.split('"')
-
-    # Initialize an empty list to hold processed segments
-    adjusted_segments = []
-
-    # Flag to track whether the current segment is inside quotes
-    inside_quotes = False
+    if '"' not in text:
+        return text
 
-    for i, segment in enumerate(segments):
-        # For segments outside of quotes (even indices), check and adjust the space before the closing quote
-        if not inside_quotes:
-            if i > 0:  # Ensure this is not the first segment
-                # Remove space at the end if it's before a closing quote
-                adjusted_segments[-1] = adjusted_segments[-1].rstrip()
-        else:
-            # For segments inside quotes (odd indices), adjust the space after the opening quote
-            segment = segment.lstrip()
+    # Split the text into segments by quotation marks; odd segments are inside quotes
+    segments = text.split('"')
+    last = segments[-1]
 
-        adjusted_segments.append(segment)
-        inside_quotes = not inside_quotes  # Toggle the inside_quotes flag
+    # Remove the space after each opening quote and before each closing quote
+    segments[1::2] = [segment.strip() for segment in segments[1::2]]
 
-    # Join the adjusted segments back together
-    return '"'.join(adjusted_segments)
+    # A quote left open at the end of the text has no closing space to remove
+    if len(segments) % 2 == 0:
+        segments[-1] = last.lstrip()
+    return '"'.join(segments)
 
 def process_summary(summary):
-    # Replace every period that is not followed by a space or is not at the end of the string with a period followed by a newline
-
-
-    summary = re.sub(r'([.?!])(?=(?!\s)[0-9A-Za-z])', r'\1\n', summary)
+    # Insert a newline after sentence punctuation that runs straight into the next word
+    summary = SENTENCE_BREAK.sub(append_newline, summary)
     summary = adjust_spaces_around_quotes(summary)
 
     # Regular expression to match 'ASIN ' or 'ISBN ' followed by the alphanumeric identifier,
     # then capture everything after it, ensuring we start with a capital letter that is
     # followed by a lowercase letter (indicating the start of the desired text).
-    match = re.search(r'(ASIN|ISBN) [A-Z0-9]+(?=[A-Z][a-z])', summary)
+    match = LEADING_IDENTIFIER.search(summary) if 'ASIN' in summary or 'ISBN' in summary else None
     # Check if a match is found
     if match:
         # Extract the desired part of the string starting from the match end position
@@ -103,32 +100,51 @@ def process_summary(summary):
         summary = summary + "."
     summary = summary.replace('An alternate cover for this ISBN can be found here', '')
     summary = summary.replace('This is an alternate cover edition of ISBN 9780451529305.\n', '')
-    summary = re.sub(r'\n\.$', '', summary)
+
+    # Drop a stray period on its own final line
+    if summary.endswith('\n.'):
+        summary = summary[:-2]
+    elif summary.endswith('\n.\n'):
+        summary = summary[:-3] + '\n'
+
     summary = add_newline_after_closing_quote(summary)
     summary = remove_asin_isbn_sentences(summary)
-    summary = re.sub(r' +\n', '\n', summary)
-    summary = re.sub(r'\n+ ', '\n\t', summary)
+
+    # Trim spaces at line ends and indent lines that start with a space, skipping the
+    # regular expressions when a plain substring check shows there is nothing to match
+    if ' \n' in summary:
+        summary = SPACES_BEFORE_NEWLINE.sub('\n', summary)
+    if '\n\n' in summary:
+        summary = NEWLINES_BEFORE_SPACE.sub('\n\t', summary)
+    else:
+        summary = summary.replace('\n ', '\n\t')
 
     return truncate_string(summary)
 
+# Name particles that stay with the last name, e.g. 'Ursula Le Guin' -> 'Le Guin, Ursula'
+NAME_PREFIXES = frozenset(['Le', 'De', 'La', 'Van', 'Von'])
+NAME_SUFFIXES = frozenset(['Jr.', 'Sr.', 'II', 'III', 'IV'])
+
+# Distinct names and date strings remembered by format_name and parse_date_result; a library
+# repeats the same authors and dates often, and the bound keeps a long bulk run flat in memory
+NAME_CACHE_SIZE = 4096
+DATE_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def format_name(name):
     """
     Format a name from 'First Last' to 'Last, First'.
-    This function includes hardcoded lists of prefixes and suffixes to correctly format complex names.
+    Prefixes (NAME_PREFIXES) and suffixes (NAME_SUFFIXES) are kept with the last name.
 
     :param name: str, name in 'First Last' format or similar
     :return: str, name in 'Last, First' format
     """
-    # Hardcoded lists of common prefixes and suffixes
-    prefixes = ['Le', 'De', 'La', 'Van', 'Von']
-    suffixes = ['Jr.', 'Sr.', 'II', 'III', 'IV']
-
     parts = name.split()
 
     # Identify if the name contains a prefix or suffix
     last_name_parts = []
     for i, part in enumerate(parts[1:], start=1):  # Skip the first name for checking
-        if parts[i] in prefixes or parts[i-1] in prefixes or part in suffixes:
+        if part in NAME_PREFIXES or parts[i-1] in NAME_PREFIXES or part in NAME_SUFFIXES:
             last_name_parts.append(part)
         else:
             # Once a non-prefix/non-suffix part is found (in middle names), add remaining parts to last_name_parts
@@ -143,31 +159,91 @@ def format_name(name):
 
     return f"{last_name}, {first_name}"
 
+def format_names(names):
+    """
+    format_name over a whole list of names, returning the formatted names in the same order.
+    A name that cannot be formatted (an empty string) comes back as None.
+    """
+    formatted = []
+    for name in names:
+        try:
+            formatted.append(format_name(name))
+        except (AttributeError, IndexError):
+            formatted.append(None)
+    return formatted
+
+# Fast paths for the two shapes of date Goodreads shows: 'January 1, 2024' and a bare year
+FULL_DATE = re.compile(r'([A-Za-z]+)\s+(\d{1,2}),\s+(\d{4})')
+YEAR_AT_END = re.compile(r'\d{4}')
+MONTHS = {datetime(2000, month, 1).strftime('%B').lower(): month for month in range(1, 13)}
+
+# Result of parse_date_result: `value` is a datetime, or None when the string holds no date;
+# `precision` is 'day', 'year' (the date is January 1 of that year) or None; `error` says
+# why the string could not be parsed
+ParsedDate = namedtuple('ParsedDate', ['value', 'precision', 'error'])
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date_result(date_string):
+    """
+    Parse a date string in the format 'January 1, 2024', falling back to a year in its last
+    four characters, into a ParsedDate. Nothing is printed; failures are described in `error`.
+    """
+    match = FULL_DATE.fullmatch(date_string)
+    if match is not None:
+        month = MONTHS.get(match.group(1).lower())
+        if month is not None:
+            try:
+                return ParsedDate(datetime(int(match.group(3)), month, int(match.group(2))), 'day', None)
+            except ValueError:
+                pass
+
+    # Assuming the year is always at the end and has four digits
+    year_part = date_string[-4:]
+    if YEAR_AT_END.fullmatch(year_part) and year_part != '0000':
+        return ParsedDate(datetime(int(year_part), 1, 1), 'year', None)
+    return ParsedDate(None, None, f"no date or year in {date_string!r}")
+
+def parse_dates(date_strings):
+    """
+    parse_date_result over a whole list of date strings, returning ParsedDates in the same order.
+    """
+    return [parse_date_result(date_string) for date_string in date_strings]
+
 """
     Parse a date string in the format 'January 1, 2024' into a datetime object without time.
     Args:
         date_string (str): The date string to parse.
     Returns:
-        datetime: A datetime object representing the date.
+        datetime: A datetime object representing the date, January 1 of the year if only
+        the year could be read, or None. See parse_date_result for why a string failed.
 """
 def parse_date(date_string):
-    # Define the full date format
-    full_date_format = "%B %d, %Y"
-    # Define the year-only format
-    year_only_format = "%Y"
-
-    try:
-        # Attempt to parse the full date string
-        parsed_date = datetime.strptime(date_string, full_date_format)
-    except ValueError:
-        try:
-            # If the full date parsing fails, extract the year part and parse it
-            # Assuming the year is always at the end and has four digits
-            year_part = date_string[-4:]
-            parsed_date = datetime.strptime(year_part, year_only_format)
-            print(f"Only the year was parsed successfully: {parsed_date.year}")
-        except ValueError as e:
-            # If parsing the year alone also fails, handle the error
-            print(f"An error occurred while parsing the year: {e}")
-            return None
-    return parsed_date
\ No newline at end of file
+    return parse_date_result(date_string).value
+
+def bounded_map(function, items, workers, on_result, on_error):
+    """
+    Call function(item) for every item on `workers` threads. Items are taken from the
+    iterable only as earlier ones finish, at most 2 x workers in flight, so memory stays flat
+    however many there are. on_result(item, result) or on_error(item, exception) is called
+    for each item as it finishes, always from the calling thread.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+
+        def drain(return_when):
+            done, _ = wait(futures, return_when=return_when)
+            for future in done:
+                item = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    on_error(item, e)
+                else:
+                    on_result(item, result)
+
+        for item in items:
+            if len(futures) >= workers * 2:
+                drain(FIRST_COMPLETED)
+            futures[executor.submit(function, item)] = item
+        if futures:
+            drain(ALL_COMPLETED)